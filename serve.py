@@ -0,0 +1,233 @@
+# Pre-fork production entry point for server.py
+#
+#   python serve.py --workers 4 --max-requests 10000
+#
+# The master imports server.py (and with it the model) once, binds the
+# listening socket and forks the workers, so every worker shares the loaded
+# booster copy-on-write. Signals to the master:
+#   SIGHUP           rolling restart, one worker at a time
+#   SIGTERM/SIGINT   graceful shutdown, in-flight requests are finished
+import argparse
+import gc
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve the prediction API with pre-forked workers')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)))
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('MAX_REQUESTS', 0)),
+                        help='recycle a worker after this many requests (0 = never)')
+    parser.add_argument('--max-requests-jitter', type=int, default=int(os.environ.get('MAX_REQUESTS_JITTER', 0)),
+                        help='random extra requests per worker so they do not all recycle at once')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds a worker gets to finish in-flight requests before it is killed')
+    parser.add_argument('--threaded', action='store_true',
+                        help='handle requests on a thread each, needed for PREDICT_MICRO_BATCH to coalesce')
+    parser.add_argument('--backlog', type=int, default=2048)
+    return parser.parse_args()
+
+
+class RequestCounter:
+    """WSGI middleware counting requests handled by this worker"""
+
+    def __init__(self, app):
+        self.app = app
+        self.count = 0
+
+    def __call__(self, environ, start_response):
+        self.count += 1
+        return self.app(environ, start_response)
+
+
+def run_worker(server_module, listener, args):
+    from werkzeug.serving import make_server
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # Ctrl+C goes to the whole process group; let the master drive shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    server_module.post_fork()
+
+    counter = RequestCounter(server_module.app)
+    server = make_server(args.host, args.port, counter, threaded=args.threaded, fd=listener.fileno())
+    # Every worker wakes on a new connection; a timeout on the shared socket
+    # keeps the losers of the accept race from blocking past a stop request
+    server.socket.settimeout(0.5)
+
+    limit = args.max_requests
+    if limit and args.max_requests_jitter:
+        limit += random.randint(0, args.max_requests_jitter)
+
+    while not stopping and not (limit and counter.count >= limit):
+        server.handle_request()
+
+    server.server_close()
+    os._exit(0)
+
+
+class Master:
+    def __init__(self, server_module, listener, args):
+        self.server_module = server_module
+        self.listener = listener
+        self.args = args
+        self.workers = set()
+        self.stopping = False
+        self.restart_requested = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(self.server_module, self.listener, self.args)
+            finally:
+                os._exit(1)
+        self.workers.add(pid)
+        return pid
+
+    def reap(self):
+        """Collect exited workers without blocking, return their pids"""
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in self.workers:
+                self.workers.discard(pid)
+                self.server_module.worker_exited(pid)
+                exited.append(pid)
+        return exited
+
+    def stop_worker(self, pid):
+        """Ask one worker to finish its request and exit, kill it after the timeout
+
+        Returns the pids of other workers that exited meanwhile, which the
+        caller must replace.
+        """
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        others = []
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while pid in self.workers and time.monotonic() < deadline:
+            others.extend(exited for exited in self.reap() if exited != pid)
+            time.sleep(0.05)
+        if pid in self.workers:
+            print(f"Worker {pid} did not stop in time, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            self.workers.discard(pid)
+            self.server_module.worker_exited(pid)
+        return others
+
+    def rolling_restart(self):
+        # The listener stays open in the master, so connections arriving while
+        # a worker is replaced simply wait in the accept backlog
+        for pid in list(self.workers):
+            if self.stopping:
+                return
+            if pid not in self.workers:
+                # Exited earlier in the restart and already replaced
+                continue
+            others = self.stop_worker(pid)
+            new_pid = self.spawn()
+            print(f"Replaced worker {pid} with {new_pid}")
+            # Recycled or crashed during the restart: run() never sees these
+            for other in others:
+                if not self.stopping:
+                    self.spawn()
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self.on_hup)
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+
+        for _ in range(self.args.workers):
+            self.spawn()
+        print(f"Serving on http://{self.args.host}:{self.args.port} "
+              f"with {self.args.workers} workers (master pid {os.getpid()})")
+
+        while not self.stopping:
+            for pid in self.reap():
+                # Recycled after max requests, or crashed: keep the pool full
+                if not self.stopping:
+                    self.spawn()
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            time.sleep(0.2)
+
+        print("Shutting down workers...")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            os.kill(pid, signal.SIGKILL)
+        self.listener.close()
+
+    def on_hup(self, signum, frame):
+        self.restart_requested = True
+
+    def on_stop(self, signum, frame):
+        self.stopping = True
+
+
+def main():
+    args = parse_args()
+
+    # One OpenMP thread per worker: the cores are shared out across processes,
+    # and libgomp thread pools created before fork() are not fork-safe
+    os.environ.setdefault('OMP_NUM_THREADS', '1')
+
+    # Load the model once in the master; with FAST_START the import returns
+    # before loading, but workers must inherit a loaded model
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+    if server.registry.current is None:
+        server.registry.reload()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(args.backlog)
+    listener.set_inheritable(True)
+
+    server.pre_fork()
+
+    # Move everything loaded so far out of the collector's reach, otherwise the
+    # first GC pass in each worker writes to (and un-shares) those pages
+    gc.collect()
+    gc.freeze()
+
+    Master(server, listener, args).run()
+
+
+if __name__ == '__main__':
+    main()
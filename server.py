@@ -1,33 +1,728 @@
 # app.py
-from flask import Flask, request, jsonify
+import time
+
+# Taken before the heavy imports so time-to-ready covers them
+LAUNCHED_AT = time.perf_counter()
+
+import functools
+import io
+import json
+import math
+import os
+import threading
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import joblib
-import pandas as pd
+import numpy as np
+
+from utils import clusters, comparables
+from utils.autocomplete import TOP_K as AUTOCOMPLETE_MAX_K, AutocompleteStore
+from utils.bulk_score import DEFAULT_CHUNK_ROWS, score_listings, to_ndjson
+from utils.heatmap import HeatmapStore
+from utils.inference_executor import InferenceExecutor, Overloaded
+from utils.attribute_index import NUMERIC_ATTRIBUTES
+from utils.inference import predict_varying
+from utils.listing_service import ListingService, decode_cursor, encode_cursor
+from utils.listings import iter_listings
+from utils.metrics import Registry as MetricsRegistry, resident_memory_bytes
+from utils.micro_batch import MicroBatcher
+from utils.model_registry import ModelRegistry
+from utils.prediction_cache import PredictionCache, normalize_key
+from utils import profiling
+from utils.prediction_grid import PredictionGrid
+from utils.shadow import ShadowScorer
+from utils.snapshot import listing_strings
+from utils.shards import REGION_FIELDS, ShardRouter
+from utils import sketches
+from utils.traffic import TrafficRecorder
 
 app = Flask(__name__)
 CORS(app)
 
-# Load the model
-model = joblib.load('./utils/house_price_prediction_model.pkl')
+# Feature columns the model was trained on (see utils/Model.py)
+FEATURES = ['beds', 'baths', 'area']
+
+# Upper bound on rows accepted by a single /predict/batch call
+MAX_BATCH_ROWS = int(os.environ.get('PREDICT_BATCH_MAX_ROWS', 100000))
+
+# Number of distinct inputs kept in the prediction cache (0 disables it)
+PREDICT_CACHE_SIZE = int(os.environ.get('PREDICT_CACHE_SIZE', 10000))
+
+# Upper bound on grid points evaluated by one /predict/sweep call
+MAX_SWEEP_POINTS = int(os.environ.get('PREDICT_SWEEP_MAX_POINTS', 40000))
+
+# Precomputed prediction grid built by `python -m utils.prediction_grid`
+PREDICT_GRID_PATH = os.environ.get('PREDICT_GRID', '')
+
+# sklearn, booster, compiled, or auto to benchmark them at startup
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'auto')
+
+# Coalesce concurrent /predict calls into one model call per window
+PREDICT_MICRO_BATCH = os.environ.get('PREDICT_MICRO_BATCH', '0') == '1'
+PREDICT_BATCH_WINDOW_MS = float(os.environ.get('PREDICT_BATCH_WINDOW_MS', 2.0))
+PREDICT_BATCH_MAX = int(os.environ.get('PREDICT_BATCH_MAX', 256))
+# Rows allowed to wait for the batcher; beyond that /predict answers 429
+PREDICT_BATCH_MAX_QUEUE = int(os.environ.get('PREDICT_BATCH_MAX_QUEUE', 1024))
+
+# OpenMP threads per XGBoost predict call. Concurrent requests each starting
+# a full thread team oversubscribe the CPU, so the default is one
+XGBOOST_NTHREAD = int(os.environ.get('XGBOOST_NTHREAD', 1))
+
+# Admission control: model calls running at once, callers allowed to wait for
+# a slot, and the default per-request deadline (X-Request-Timeout-Ms overrides)
+PREDICT_MAX_CONCURRENCY = int(os.environ.get('PREDICT_MAX_CONCURRENCY', os.cpu_count() or 1))
+PREDICT_MAX_QUEUE = int(os.environ.get('PREDICT_MAX_QUEUE', 64))
+PREDICT_DEADLINE_MS = float(os.environ.get('PREDICT_DEADLINE_MS', 1000))
+
+MODEL_PATH = './utils/house_price_prediction_model.pkl'
+
+# Versioned artifacts written by utils/Model.py; the newest one is served
+MODEL_DIR = os.environ.get('MODEL_DIR', './utils/models')
+
+# Candidate models scored in the background on a sample of /predict inputs,
+# as comma-separated versions in MODEL_DIR or artifact paths
+SHADOW_MODELS = [entry.strip() for entry in os.environ.get('SHADOW_MODELS', '').split(',') if entry.strip()]
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', 0.1))
+SHADOW_MAX_QUEUE = int(os.environ.get('SHADOW_MAX_QUEUE', 10000))
+SHADOW_BATCH_SIZE = int(os.environ.get('SHADOW_BATCH_SIZE', 256))
+
+# Per-region models, one subdirectory of versioned artifacts per state or
+# country (e.g. regions/CA/), loaded on first use. The loaded shards' artifact
+# files are kept under MODEL_SHARD_ARTIFACT_MB in total (MODEL_SHARD_MEMORY_MB
+# is the former name); it bounds file size, not the memory boosters take
+MODEL_REGIONS_DIR = os.environ.get('MODEL_REGIONS_DIR', './utils/models/regions')
+MODEL_SHARD_ARTIFACT_MB = float(os.environ.get('MODEL_SHARD_ARTIFACT_MB',
+                                               os.environ.get('MODEL_SHARD_MEMORY_MB', 256)))
+
+# Seconds between checks of MODEL_DIR for a new artifact and of MODEL_REGIONS_DIR
+# for new shards (0 disables the watcher)
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 5))
+
+# Load the model in the background and report readiness on /ready instead
+# of blocking import; requests get 503 until the model is warmed up
+FAST_START = os.environ.get('FAST_START', '0') == '1'
+
+# Shared secret for /admin endpoints; they are disabled when unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Allow admins to profile single requests with an X-Profile header. When off,
+# the prediction views are left undecorated and pay nothing
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '1') == '1'
+
+# Upper bound on one sampling profile, taken in a background thread
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 60))
+
+# Append sampled /predict calls to a binary capture log for utils.traffic replay
+PREDICT_CAPTURE_DIR = os.environ.get('PREDICT_CAPTURE_DIR', '')
+PREDICT_CAPTURE_SAMPLE = float(os.environ.get('PREDICT_CAPTURE_SAMPLE', 1.0))
+PREDICT_CAPTURE_MAX_MB = float(os.environ.get('PREDICT_CAPTURE_MAX_MB', 64))
+
+# Streaming sketches of /predict inputs and predictions for drift monitoring.
+# With several workers, each writes its sketches to DRIFT_SPOOL_DIR so any
+# worker can answer /predict/drift for all of them
+DRIFT_MONITOR = os.environ.get('DRIFT_MONITOR', '1') == '1'
+DRIFT_SPOOL_DIR = os.environ.get('DRIFT_SPOOL_DIR', '')
+DRIFT_FLUSH_INTERVAL = float(os.environ.get('DRIFT_FLUSH_INTERVAL', 10))
+
+# Training distributions written by utils/Model.py, used when the serving
+# artifact has no <artifact>.sketch.json of its own
+REFERENCE_SKETCH_PATH = './utils/reference_sketch.json'
+
+# Columnar listing snapshot written by `python -m utils.snapshot build`; the
+# /listings queries index it in memory and pick up rebuilds automatically
+LISTINGS_SNAPSHOT = os.environ.get('LISTINGS_SNAPSHOT', './utils/listings_snapshot')
+LISTINGS_DEFAULT_LIMIT = int(os.environ.get('LISTINGS_DEFAULT_LIMIT', 200))
+LISTINGS_MAX_LIMIT = int(os.environ.get('LISTINGS_MAX_LIMIT', 1000))
+
+# Seconds browsers may reuse a listing tile before revalidating its ETag
+LISTINGS_TILE_MAX_AGE = int(os.environ.get('LISTINGS_TILE_MAX_AGE', 300))
+
+# Price per sq ft tiles written by `python -m utils.heatmap build`. Tile URLs
+# name the build, so their content never changes and browsers may keep them
+HEATMAP_DIR = os.environ.get('HEATMAP_DIR', './utils/listings_heatmap')
+HEATMAP_TILE_MAX_AGE = int(os.environ.get('HEATMAP_TILE_MAX_AGE', 365 * 24 * 3600))
+
+# Comparable homes returned by default and at most
+COMPARABLES_DEFAULT_K = int(os.environ.get('COMPARABLES_DEFAULT_K', 10))
+COMPARABLES_MAX_K = int(os.environ.get('COMPARABLES_MAX_K', 100))
+
+# Place name index written by `python -m utils.autocomplete build`, reopened
+# when rebuilt
+AUTOCOMPLETE_INDEX = os.environ.get('AUTOCOMPLETE_INDEX', './utils/autocomplete_index')
+
+prediction_cache = PredictionCache(PREDICT_CACHE_SIZE)
+
+traffic_recorder = None
+if PREDICT_CAPTURE_DIR:
+    traffic_recorder = TrafficRecorder(
+        PREDICT_CAPTURE_DIR, PREDICT_CAPTURE_SAMPLE, int(PREDICT_CAPTURE_MAX_MB * (1 << 20)))
+
+inference_executor = InferenceExecutor(PREDICT_MAX_CONCURRENCY, PREDICT_MAX_QUEUE, PREDICT_DEADLINE_MS)
+
+# Prometheus metrics served on /metrics
+metrics = MetricsRegistry()
+http_requests = metrics.counter(
+    'http_requests_total', 'HTTP requests handled, by route and status', ('endpoint', 'status'))
+http_latency = metrics.histogram(
+    'http_request_duration_seconds', 'Time from request start to response, by route', ('endpoint',))
+predict_stage_latency = metrics.histogram(
+    'predict_stage_duration_seconds',
+    'Time spent parsing input, running inference and serializing the response', ('endpoint', 'stage'))
+model_load_seconds = metrics.gauge(
+    'model_load_seconds', 'Seconds taken to load and warm up the serving model', ('version',))
+model_info = metrics.gauge(
+    'model_info', 'Serving model version and inference backend', ('version', 'backend'))
+metrics.gauge(
+    'process_resident_memory_bytes', 'Resident set size of this process',
+    callback=lambda: {(): resident_memory_bytes()})
+metrics.counter(
+    'prediction_cache_lookups_total', 'Prediction cache lookups by result', ('result',),
+    callback=lambda: {('hit',): prediction_cache.hits, ('miss',): prediction_cache.misses})
+metrics.counter(
+    'inference_shed_total', 'Requests rejected with 429 by admission control, by reason', ('reason',),
+    callback=lambda: {(reason,): count for reason, count in inference_executor.shed.items()})
+metrics.gauge(
+    'inference_in_flight', 'Model calls running or waiting for a slot', ('state',),
+    callback=lambda: {('running',): inference_executor.running, ('waiting',): inference_executor.waiting})
+metrics.counter(
+    'prediction_cache_evictions_total', 'Entries evicted from the prediction cache',
+    callback=lambda: {(): prediction_cache.evictions})
+metrics.counter(
+    'shadow_rows_total', 'Sampled /predict inputs offered to shadow scoring, by outcome', ('result',),
+    callback=lambda: {('enqueued',): shadow_scorer.enqueued, ('dropped',): shadow_scorer.dropped}
+    if shadow_scorer is not None else {})
+metrics.counter(
+    'model_shard_requests_total', 'Requests routed to each regional model', ('region',),
+    callback=lambda: {(region,): shard['requests'] for region, shard in shard_router.shard_stats().items()})
+metrics.counter(
+    'model_shard_loads_total', 'Regional model loads, including reloads after eviction', ('region',),
+    callback=lambda: {(region,): shard['loads'] for region, shard in shard_router.shard_stats().items()})
+metrics.counter(
+    'model_shard_evictions_total', 'Regional models evicted to stay within the artifact budget', ('region',),
+    callback=lambda: {(region,): shard['evictions'] for region, shard in shard_router.shard_stats().items()})
+metrics.gauge(
+    'model_shard_load_seconds', 'Seconds taken by the latest load of each regional model', ('region',),
+    callback=lambda: {(region,): shard['loadSeconds'] for region, shard in shard_router.shard_stats().items()
+                      if shard['loadSeconds'] is not None})
+metrics.gauge(
+    'model_shard_resident_bytes', 'Artifact bytes of the regional models currently loaded',
+    callback=lambda: {(): shard_router.resident_bytes()})
+metrics.counter(
+    'model_shard_fallbacks_total', 'Requests naming a region that were served by the global model',
+    callback=lambda: {(): shard_router.fallbacks})
+
+profile_store = profiling.ProfileStore()
+
+shadow_scorer = None
+if SHADOW_MODELS:
+    shadow_scorer = ShadowScorer(SHADOW_SAMPLE_RATE, SHADOW_MAX_QUEUE, SHADOW_BATCH_SIZE)
+
+distribution_monitor = None
+if DRIFT_MONITOR:
+    distribution_monitor = sketches.DistributionMonitor(DRIFT_SPOOL_DIR, DRIFT_FLUSH_INTERVAL)
+
+listing_service = ListingService(LISTINGS_SNAPSHOT)
+heatmap_store = HeatmapStore(HEATMAP_DIR)
+autocomplete_store = AutocompleteStore(AUTOCOMPLETE_INDEX)
+
+prediction_grid = None
+if PREDICT_GRID_PATH:
+    prediction_grid = PredictionGrid(PREDICT_GRID_PATH)
+
+
+seconds_to_ready = None
+
+
+def on_model_swap(handle):
+    global seconds_to_ready
+    model_load_seconds.replace({(handle.version,): handle.load_seconds})
+    model_info.replace({(handle.version, handle.backend.name): 1})
+    for name, result in handle.backend_report.items():
+        print(f"Inference backend {name}: {result['singleRowMicros']:.1f} us for one row, "
+              f"{result['batchRowMicros']:.1f} us/row in a batch, parity {'ok' if result['parity'] else 'FAILED'}")
+    if hasattr(handle.backend, 'batch_rows'):
+        print(f"Inputs of {handle.backend.batch_rows} rows or more go to the {handle.backend.batch.name} backend")
+    # Entries scored by the previous model are dropped
+    prediction_cache.set_model_version(handle.version)
+    if shadow_scorer is not None:
+        # Comparisons against the previous model no longer say anything
+        shadow_scorer.reset(handle.version)
+    if prediction_grid is not None and prediction_grid.model_version != handle.version:
+        # A grid scored by another model would serve stale prices; it is only
+        # consulted while its version matches the serving model
+        print(f"Prediction grid {PREDICT_GRID_PATH} was built for model "
+              f"{prediction_grid.model_version}, serving {handle.version}; grid disabled")
+    if seconds_to_ready is None:
+        seconds_to_ready = time.perf_counter() - LAUNCHED_AT
+        print(f"Ready in {seconds_to_ready:.2f}s after launch")
+
+
+# Load the model; auto backend selection keeps the fastest one that matches sklearn
+registry = ModelRegistry(MODEL_DIR, MODEL_PATH, INFERENCE_BACKEND, XGBOOST_NTHREAD)
+registry.on_swap(on_model_swap)
+if not FAST_START:
+    registry.reload()
+
+
+
+def load_secondary_model(path):
+    # Regional shards and shadow candidates reuse the backend picked for the
+    # global model, and its row-count crossover, instead of benchmarking
+    # every backend again; shards load on the request path
+    handle = registry.current
+    if handle is None:
+        return registry.load(path)
+    preference = handle.backend.name if INFERENCE_BACKEND == 'auto' else None
+    return registry.load(path, preference, getattr(handle.backend, 'batch_rows', None))
+
+
+def load_shadow_candidates():
+    for entry in SHADOW_MODELS:
+        try:
+            path = entry if os.path.exists(entry) else registry.resolve(entry)
+            handle = load_secondary_model(path)
+        except Exception as e:
+            print(f"Loading shadow model {entry} failed: {str(e)}")
+            continue
+        shadow_scorer.add_candidate(handle.version, handle)
+        print(f"Shadow scoring {SHADOW_SAMPLE_RATE:.0%} of /predict traffic with model version {handle.version}")
+
+
+shard_router = ShardRouter(MODEL_REGIONS_DIR, load_secondary_model, int(MODEL_SHARD_ARTIFACT_MB * (1 << 20)))
+# New shards and versions are found by the model watcher, off the request path
+registry.on_poll(shard_router.rescan)
+
+
+def predict_current(matrix):
+    return registry.current.backend.predict(matrix)
+
+
+micro_batcher = None
+
+
+def start_background_tasks():
+    """Start the threads the server relies on; call again in every forked worker"""
+    global micro_batcher
+    if registry.current is None:
+        registry.reload_in_background()
+    if PREDICT_MICRO_BATCH:
+        micro_batcher = MicroBatcher(predict_current, PREDICT_BATCH_WINDOW_MS, PREDICT_BATCH_MAX,
+                                     PREDICT_BATCH_MAX_QUEUE)
+    registry.start_watcher(MODEL_WATCH_INTERVAL)
+    # Open the listing snapshot and build its indexes before the first query
+    threading.Thread(target=listing_service.current, name='listings-open', daemon=True).start()
+    if distribution_monitor is not None:
+        distribution_monitor.start_flusher()
+    if shadow_scorer is not None:
+        # Candidates load off the startup path; rows offered meanwhile are
+        # scored once they are in
+        threading.Thread(target=load_shadow_candidates, name='shadow-load', daemon=True).start()
+        shadow_scorer.start()
+
+
+def pre_fork():
+    """Called once by the serve.py master before it forks the first worker"""
+    if distribution_monitor is not None:
+        # Sketches spooled by a previous run describe traffic it served
+        distribution_monitor.clear_spool()
+
+
+def post_fork():
+    # Threads do not survive fork(), so each worker starts its own
+    start_background_tasks()
+
+
+def worker_exited(pid):
+    """Called by the serve.py master for every worker it reaps"""
+    if distribution_monitor is not None:
+        distribution_monitor.forget_worker(pid)
+
+
+def admin_error():
+    """Error response for a request lacking admin rights, or None when allowed"""
+    if not ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': 'admin endpoints are disabled'}), 403
+    if request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'success': False, 'error': 'invalid admin token'}), 401
+    return None
+
+
+def profiled(view):
+    """Trace the view deterministically when an admin sends X-Profile: 1
+
+    The folded stacks (microseconds of self time) are kept in profile_store
+    and the response carries their id in X-Profile-Id.
+    """
+    if not PROFILE_REQUESTS:
+        return view
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.headers.get('X-Profile') != '1' or admin_error() is not None:
+            return view(*args, **kwargs)
+        result, counts = profiling.trace(view, *args, **kwargs)
+        response = app.make_response(result)
+        response.headers['X-Profile-Id'] = profile_store.add(counts)
+        return response
+
+    return wrapper
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if traffic_recorder is not None:
+        g.request_arrived = time.time()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # The route pattern, not the raw path, keeps label cardinality bounded
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    http_requests.inc(labels=(endpoint, str(response.status_code)))
+    started = g.get('request_started')
+    if started is not None:
+        latency = time.perf_counter() - started
+        http_latency.observe(latency, (endpoint,))
+        if traffic_recorder is not None and endpoint == '/predict':
+            capture_request(latency, response.status_code)
+    return response
+
+
+def capture_request(latency, status):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    traffic_recorder.record(g.request_arrived, to_float(data.get('beds')), to_float(data.get('baths')),
+                            to_float(data.get('area')), latency, status)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def coerce_column(values):
+    """Float array of values with anything unparsable as NaN"""
+    try:
+        # Numbers, numeric strings and None convert in one vectorized pass
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([to_float(value) for value in values], dtype=np.float64)
+
+
+def parse_batch(data):
+    """Turn a batch payload into a float matrix, a validity mask and per-row errors"""
+    if isinstance(data, dict) and 'records' in data:
+        data = data['records']
+
+    if isinstance(data, list):
+        # Row-oriented: [{"beds": 3, "baths": 2, "area": 1500}, ...]
+        columns = {
+            feature: [row.get(feature) if isinstance(row, dict) else None for row in data]
+            for feature in FEATURES
+        }
+    elif isinstance(data, dict) and all(feature in data for feature in FEATURES):
+        # Columnar: {"beds": [...], "baths": [...], "area": [...]}
+        columns = {feature: data[feature] for feature in FEATURES}
+        if not all(isinstance(values, list) for values in columns.values()):
+            raise ValueError('columnar payload must map each feature to a list')
+        if len({len(values) for values in columns.values()}) != 1:
+            raise ValueError('columnar payload must have equal-length feature lists')
+    else:
+        raise ValueError(
+            'expected a list of records, {"records": [...]} or columns for ' + ', '.join(FEATURES))
+
+    n_rows = len(columns[FEATURES[0]])
+    if n_rows > MAX_BATCH_ROWS:
+        raise ValueError(f'batch of {n_rows} rows exceeds the limit of {MAX_BATCH_ROWS}')
+
+    matrix = np.empty((n_rows, len(FEATURES)), dtype=np.float64)
+    for i, feature in enumerate(FEATURES):
+        matrix[:, i] = coerce_column(columns[feature])
+
+    invalid = ~np.isfinite(matrix)
+    valid = ~invalid.any(axis=1)
+
+    errors = []
+    for index in np.flatnonzero(~valid):
+        fields = [FEATURES[i] for i in np.flatnonzero(invalid[index])]
+        errors.append({
+            'index': int(index),
+            'error': 'invalid or missing ' + ', '.join(fields)
+        })
+
+    return matrix, valid, errors
+
+
+def sweep_axis(name, spec):
+    """Values of one swept feature from a list or {"start", "stop", "step" | "num"}"""
+    if isinstance(spec, list):
+        values = coerce_column(spec)
+    elif isinstance(spec, dict) and 'start' in spec and 'stop' in spec:
+        start, stop = to_float(spec['start']), to_float(spec['stop'])
+        if 'num' in spec:
+            num = to_float(spec['num'])
+            # Checked before np.linspace allocates anything
+            if not (1 <= num <= MAX_SWEEP_POINTS and num.is_integer()):
+                raise ValueError(f'{name}: num must be an integer between 1 and {MAX_SWEEP_POINTS}')
+            values = np.linspace(start, stop, int(num))
+        elif 'step' in spec:
+            step = to_float(spec['step'])
+            if not step > 0 or not stop >= start:
+                raise ValueError(f'{name}: step must be positive and stop at least start')
+            count = int(np.floor((stop - start) / step + 1e-9)) + 1
+            if count > MAX_SWEEP_POINTS:
+                raise ValueError(f'{name}: {count} values exceed the limit of {MAX_SWEEP_POINTS}')
+            # Computed from the index rather than accumulated, so the stop is hit exactly
+            values = start + step * np.arange(count)
+        else:
+            raise ValueError(f'{name}: a range needs "step" or "num"')
+    else:
+        raise ValueError(f'{name}: expected a list of values or {{"start", "stop", "step"|"num"}}')
+    if not len(values) or not np.isfinite(values).all():
+        raise ValueError(f'{name}: values must be a non-empty list of numbers')
+    return values
+
+
+def parse_sweep(data):
+    """Feature matrix over the grid of one or two swept features, and the axes"""
+    if not isinstance(data, dict) or not isinstance(data.get('sweep'), dict):
+        raise ValueError('expected {"fixed": {...}, "sweep": {feature: values or range}}')
+    fixed = data.get('fixed') or {}
+    sweep = data['sweep']
+    unknown = [name for name in list(fixed) + list(sweep) if name not in FEATURES]
+    if unknown:
+        raise ValueError('unknown features: ' + ', '.join(unknown))
+    if not 1 <= len(sweep) <= 2:
+        raise ValueError('sweep one or two features')
+    both = [name for name in sweep if name in fixed]
+    if both:
+        raise ValueError('features both fixed and swept: ' + ', '.join(both))
+    missing = [name for name in FEATURES if name not in fixed and name not in sweep]
+    if missing:
+        raise ValueError('missing fixed values for ' + ', '.join(missing))
+
+    axes = [(name, sweep_axis(name, spec)) for name, spec in sweep.items()]
+    shape = tuple(len(values) for _, values in axes)
+    n_points = int(np.prod(shape))
+    if n_points > MAX_SWEEP_POINTS:
+        raise ValueError(f'sweep of {n_points} points exceeds the limit of {MAX_SWEEP_POINTS}')
+
+    matrix = np.empty((n_points, len(FEATURES)), dtype=np.float64)
+    grids = dict(zip([name for name, _ in axes],
+                     np.meshgrid(*[values for _, values in axes], indexing='ij')))
+    for i, feature in enumerate(FEATURES):
+        if feature in grids:
+            matrix[:, i] = grids[feature].ravel()
+        else:
+            value = to_float(fixed[feature])
+            if not np.isfinite(value):
+                raise ValueError(f'invalid fixed value for {feature}')
+            matrix[:, i] = value
+    return matrix, axes, shape
+
+
+def batch_regions(data, n_rows):
+    """Shard name, or None for the global model, of every row of a batch payload"""
+    if not shard_router.available():
+        return [None] * n_rows
+    if isinstance(data, dict) and 'records' in data:
+        data = data['records']
+    if isinstance(data, list):
+        return [shard_router.route(row) if isinstance(row, dict) else None for row in data]
+    # Columnar payloads carry regions as lists next to the features
+    columns = {field: data[field] for field in REGION_FIELDS
+               if isinstance(data.get(field), list) and len(data[field]) == n_rows}
+    return [shard_router.route({field: values[i] for field, values in columns.items()})
+            for i in range(n_rows)]
+
+
+def request_deadline():
+    return inference_executor.deadline(request.headers.get('X-Request-Timeout-Ms', type=float))
+
+
+def overloaded(e):
+    return jsonify({
+        'success': False,
+        'error': f'server overloaded ({e.reason}), retry later'
+    }), 429, {'Retry-After': str(e.retry_after)}
+
+
+def not_ready():
+    return jsonify({
+        'success': False,
+        'error': 'model is still loading'
+    }), 503
+
+
+def record_stages(endpoint, started, parsed, inferred):
+    finished = time.perf_counter()
+    predict_stage_latency.observe(parsed - started, (endpoint, 'parse'))
+    predict_stage_latency.observe(inferred - parsed, (endpoint, 'inference'))
+    predict_stage_latency.observe(finished - inferred, (endpoint, 'serialize'))
 
 
 @app.route('/predict', methods=['POST'])
+@profiled
 def predict():
     try:
+        # The whole request is served by the model that is current now,
+        # even if a new version is swapped in meanwhile
+        handle = registry.current
+        if handle is None:
+            return not_ready()
+        started = time.perf_counter()
+        deadline = request_deadline()
         data = request.json
-        input_data = pd.DataFrame({
-            'beds': [float(data['beds'])],
-            'baths': [float(data['baths'])],
-            'area': [float(data['area'])],
+        key = normalize_key(data['beds'], data['baths'], data['area'])
+        region = shard_router.route(data)
+        parsed = time.perf_counter()
+
+        # A regional model replaces the global one when the request's region
+        # has a shard; the grid and the cache only hold global predictions
+        shard = shard_router.get(region) if region is not None else None
+        serving = shard or handle
+        prediction = None
+        if shard is None:
+            if prediction_grid is not None and prediction_grid.model_version == handle.version:
+                prediction = prediction_grid.lookup(*key)
+            if prediction is None:
+                prediction = prediction_cache.get(handle.version, key)
+        if prediction is None:
+            if micro_batcher is not None:
+                # The batcher's single thread already serializes model calls;
+                # its bounded queue and the deadline shed load instead
+                prediction = float(micro_batcher.predict(key, serving.backend.predict, deadline))
+            else:
+                input_data = np.array([key], dtype=np.float64)
+                prediction = float(inference_executor.run(
+                    serving.backend.predict, input_data, deadline=deadline)[0])
+            if shard is None:
+                prediction_cache.put(handle.version, key, prediction)
+        inferred = time.perf_counter()
+        if shadow_scorer is not None and shard is None:
+            shadow_scorer.offer(key, prediction)
+        if distribution_monitor is not None:
+            distribution_monitor.observe(key[0], key[1], key[2], prediction)
+
+        response = jsonify({
+            'success': True,
+            'predictedPrice': prediction,
+            'modelVersion': serving.version,
+            'region': region if shard is not None else None
+        })
+        record_stages('/predict', started, parsed, inferred)
+        return response
+    except Overloaded as e:
+        return overloaded(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
+
+@app.route('/predict/batch', methods=['POST'])
+@profiled
+def predict_batch():
+    try:
+        started = time.perf_counter()
+        deadline = request_deadline()
+        data = request.get_json(force=True)
+        matrix, valid, errors = parse_batch(data)
+        regions = batch_regions(data, len(matrix))
+        parsed = time.perf_counter()
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    try:
+        handle = registry.current
+        if handle is None:
+            return not_ready()
+        predictions = [None] * len(matrix)
+        groups = {}
+        for index in np.flatnonzero(valid):
+            groups.setdefault(regions[index], []).append(index)
+        shard_versions = {}
+        for region, rows in groups.items():
+            serving = shard_router.get(region) if region is not None else None
+            if serving is None:
+                serving = handle
+            else:
+                shard_versions[region] = serving.version
+            # One vectorized call per model serving rows of this batch
+            scores = inference_executor.run(serving.backend.predict, matrix[rows], deadline=deadline)
+            for index, score in zip(rows, scores.tolist()):
+                predictions[index] = score
+        inferred = time.perf_counter()
+        if distribution_monitor is not None and valid.any():
+            distribution_monitor.observe_many(
+                matrix[valid], np.array([predictions[index] for index in np.flatnonzero(valid)]))
+
+        response = jsonify({
+            'success': True,
+            'count': len(predictions),
+            'predictedPrices': predictions,
+            'errors': errors,
+            'modelVersion': handle.version,
+            'regions': shard_versions
         })
+        record_stages('/predict/batch', started, parsed, inferred)
+        return response
+    except Overloaded as e:
+        return overloaded(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
-        prediction = model.predict(input_data)[0]
 
+@app.route('/predict/sweep', methods=['POST'])
+@profiled
+def predict_sweep():
+    """Price curve over one swept feature, or surface over two, in one model call"""
+    try:
+        started = time.perf_counter()
+        deadline = request_deadline()
+        data = request.get_json(force=True)
+        matrix, axes, shape = parse_sweep(data)
+        region = shard_router.route(data)
+        parsed = time.perf_counter()
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    try:
+        handle = registry.current
+        if handle is None:
+            return not_ready()
+        shard = shard_router.get(region) if region is not None else None
+        serving = shard or handle
+        columns = [FEATURES.index(name) for name, _ in axes]
+        scores = inference_executor.run(predict_varying, serving.backend, matrix, columns, deadline=deadline)
+        inferred = time.perf_counter()
+
+        response = jsonify({
             'success': True,
-            'predictedPrice': float(prediction)
+            'axes': [{'name': name, 'values': values.tolist()} for name, values in axes],
+            # A list for one axis, rows over the first axis for two
+            'predictedPrices': np.asarray(scores, dtype=np.float64).reshape(shape).tolist(),
+            'modelVersion': serving.version,
+            'region': region if shard is not None else None
         })
+        record_stages('/predict/sweep', started, parsed, inferred)
+        return response
+    except Overloaded as e:
+        return overloaded(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -35,5 +730,560 @@ def predict():
         }), 500
 
 
+@app.route('/predict/stream', methods=['POST'])
+def predict_stream():
+    """Score an NDJSON or JSON-array body of listings, streaming NDJSON results back"""
+    handle = registry.current
+    if handle is None:
+        return not_ready()
+    chunk_rows = min(request.args.get('chunkRows', DEFAULT_CHUNK_ROWS, type=int), MAX_BATCH_ROWS)
+    full = request.args.get('full', '0') == '1'
+    timeout_ms = request.headers.get('X-Request-Timeout-Ms', type=float)
+
+    def predict_chunk(matrix):
+        # Each chunk is admitted on its own, so a long upload holds a model
+        # slot only while one of its chunks is being scored
+        return inference_executor.run(handle.backend.predict, matrix,
+                                      deadline=inference_executor.deadline(timeout_ms))
+
+    def generate():
+        # Read the body as it arrives instead of buffering the whole upload
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+        try:
+            results = score_listings(iter_listings(stream), predict_chunk, chunk_rows, full)
+            yield from to_ndjson(results)
+        except Overloaded as e:
+            yield json.dumps({
+                'success': False,
+                'error': f'server overloaded ({e.reason}), retry later',
+                'retryAfter': e.retry_after
+            }) + '\n'
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield json.dumps({'success': False, 'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Model-Version': handle.version})
+
+
+@app.route('/predict/backend', methods=['GET'])
+def predict_backend_info():
+    handle = registry.current
+    if handle is None:
+        return not_ready()
+    return jsonify({
+        'backend': handle.backend.name,
+        'batchRows': getattr(handle.backend, 'batch_rows', None),
+        'benchmark': handle.backend_report
+    })
+
+
+@app.route('/predict/batcher', methods=['GET'])
+def predict_batcher_stats():
+    if micro_batcher is None:
+        return jsonify({'enabled': False})
+    stats = micro_batcher.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+
+@app.route('/predict/executor', methods=['GET'])
+def predict_executor_stats():
+    stats = inference_executor.stats()
+    stats['xgboostThreads'] = XGBOOST_NTHREAD
+    return jsonify(stats)
+
+
+@app.route('/predict/shadow', methods=['GET'])
+def predict_shadow_stats():
+    if shadow_scorer is None:
+        return jsonify({'enabled': False})
+    stats = shadow_scorer.stats()
+    stats['enabled'] = True
+    return jsonify(stats)
+
+
+@app.route('/predict/cache', methods=['GET'])
+def predict_cache_stats():
+    stats = prediction_cache.stats()
+    stats['grid'] = prediction_grid.stats() if prediction_grid is not None else None
+    return jsonify(stats)
+
+
+def reference_sketch_path(handle):
+    path = os.path.splitext(handle.path)[0] + '.sketch.json'
+    return path if os.path.exists(path) else REFERENCE_SKETCH_PATH
+
+
+@app.route('/predict/drift', methods=['GET'])
+def predict_drift():
+    """Live input and prediction distributions, compared with the training data"""
+    if distribution_monitor is None:
+        return jsonify({'enabled': False})
+    live, workers = distribution_monitor.merged()
+    result = {
+        'enabled': True,
+        'workers': workers,
+        'live': {name: distribution.summary() for name, distribution in live.items()},
+        'reference': None,
+        'comparison': None
+    }
+    handle = registry.current
+    if handle is not None:
+        path = reference_sketch_path(handle)
+        try:
+            reference = sketches.load_reference(path)
+        except (OSError, ValueError, KeyError):
+            reference = None
+        if reference is not None:
+            result['reference'] = {name: distribution.summary() for name, distribution in reference.items()}
+            result['referencePath'] = path
+            result['comparison'] = sketches.compare(live, reference)
+    return jsonify(result)
+
+
+def listings_unavailable():
+    error = listing_service.last_error or f'no listing snapshot at {LISTINGS_SNAPSHOT}'
+    return jsonify({'success': False, 'error': error}), 503
+
+
+def query_number(name, default=None):
+    """Float query parameter; ValueError when it is missing or not a finite number"""
+    value = request.args.get(name)
+    if value is None:
+        if default is None:
+            raise ValueError(f'missing query parameter {name}')
+        return default
+    number = to_float(value)
+    if not np.isfinite(number):
+        raise ValueError(f'{name} must be a number')
+    return number
+
+
+def query_limit():
+    """?limit= page size; ValueError unless it is an integer in range"""
+    value = request.args.get('limit')
+    if value is None:
+        return LISTINGS_DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= LISTINGS_MAX_LIMIT:
+        raise ValueError(f'limit must be an integer between 1 and {LISTINGS_MAX_LIMIT}')
+    return limit
+
+
+@app.route('/listings/bbox', methods=['GET'])
+def listings_bbox():
+    """Listings inside a map viewport, in pages of ?limit= with a cursor to the next page"""
+    indexes = listing_service.current()
+    if indexes is None:
+        return listings_unavailable()
+    try:
+        south, west = query_number('south'), query_number('west')
+        north, east = query_number('north'), query_number('east')
+        if not -90 <= south <= north <= 90 or not (-180 <= west <= 180 and -180 <= east <= 180):
+            raise ValueError('expected -90 <= south <= north <= 90 and longitudes in [-180, 180]; '
+                             'west > east crosses the antimeridian')
+        limit = query_limit()
+        cursor = request.args.get('cursor')
+        after = -1
+        if cursor:
+            after, = decode_cursor(cursor, indexes.generation)
+            after = int(after)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    rows, position = indexes.spatial.bbox(south, west, north, east, limit, after)
+    listings = indexes.listings(rows)
+    return jsonify({
+        'success': True,
+        'count': len(listings),
+        'listings': listings,
+        'nextCursor': encode_cursor(indexes.generation, position) if position is not None else None
+    })
+
+
+@app.route('/listings/radius', methods=['GET'])
+def listings_radius():
+    """Listings within ?radiusKm= of a point, nearest first, paged like /listings/bbox"""
+    indexes = listing_service.current()
+    if indexes is None:
+        return listings_unavailable()
+    try:
+        lat, lon = query_number('lat'), query_number('lon')
+        radius_km = query_number('radiusKm')
+        if not -90 <= lat <= 90 or not -180 <= lon <= 180 or not radius_km > 0:
+            raise ValueError('lat and lon must be valid coordinates and radiusKm positive')
+        limit = query_limit()
+        cursor = request.args.get('cursor')
+        after = None
+        if cursor:
+            distance, row = decode_cursor(cursor, indexes.generation)
+            after = (float(distance), int(row))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    rows, distances, last = indexes.spatial.radius(lat, lon, radius_km, limit, after)
+    listings = indexes.listings(rows)
+    for listing, distance in zip(listings, distances.tolist()):
+        listing['distanceKm'] = distance
+    return jsonify({
+        'success': True,
+        'count': len(listings),
+        'listings': listings,
+        'nextCursor': encode_cursor(indexes.generation, *last) if last is not None else None
+    })
+
+
+@app.route('/listings/search', methods=['GET'])
+def listings_search():
+    """Listings matching ?priceMin=&bedsMax=...&source=, sorted by ?sort= and ?order=, paged by cursor"""
+    indexes = listing_service.current()
+    if indexes is None:
+        return listings_unavailable()
+    try:
+        ranges = {}
+        for name in NUMERIC_ATTRIBUTES:
+            low, high = request.args.get(f'{name}Min'), request.args.get(f'{name}Max')
+            if low is not None or high is not None:
+                ranges[name] = (query_number(f'{name}Min') if low is not None else None,
+                                query_number(f'{name}Max') if high is not None else None)
+        categories = {}
+        if request.args.get('source'):
+            categories['source'] = indexes.attributes.category_codes('source', request.args['source'].split(','))
+        sort = request.args.get('sort', 'id')
+        sort_keys = ('id',) + NUMERIC_ATTRIBUTES
+        if sort not in sort_keys:
+            raise ValueError('sort must be one of ' + ', '.join(sort_keys))
+        order = request.args.get('order', 'asc')
+        if order not in ('asc', 'desc'):
+            raise ValueError('order must be asc or desc')
+        descending = order == 'desc'
+        limit = query_limit()
+        cursor = request.args.get('cursor')
+        after = -1
+        if cursor:
+            sort_index, cursor_descending, after = decode_cursor(cursor, indexes.generation)
+            if (sort_index, bool(cursor_descending)) != (sort_keys.index(sort), descending):
+                raise ValueError('cursor was issued for a different sort order')
+            after = int(after)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    rows, total, position = indexes.attributes.search(ranges, categories, sort, descending, limit, after)
+    listings = indexes.listings(rows)
+    return jsonify({
+        'success': True,
+        'total': total,
+        'count': len(listings),
+        'listings': listings,
+        'nextCursor': encode_cursor(indexes.generation, sort_keys.index(sort), int(descending), position)
+        if position is not None else None
+    })
+
+
+def comparables_k(value):
+    k = COMPARABLES_DEFAULT_K if value is None else int(value)
+    if not 1 <= k <= COMPARABLES_MAX_K:
+        raise ValueError(f'k must be between 1 and {COMPARABLES_MAX_K}')
+    return k
+
+
+def comparables_response(indexes, query, rows, feature_distances, distances):
+    listings = indexes.listings(rows)
+    for listing, feature_distance, distance in zip(listings, feature_distances.tolist(), distances.tolist()):
+        listing['distanceKm'] = distance
+        # Lower is more alike, unlike a similarity
+        listing['featureDistance'] = feature_distance
+    return jsonify({
+        'success': True,
+        'query': query,
+        'count': len(listings),
+        'comparables': listings,
+        'summary': comparables.summarize([listing['price'] for listing in listings],
+                                         [listing['area'] for listing in listings])
+    })
+
+
+@app.route('/predict/comparables', methods=['POST'])
+def predict_comparables():
+    """The k listings most like a /predict input, located by latitude/longitude or by city"""
+    indexes = listing_service.current()
+    if indexes is None:
+        return listings_unavailable()
+    try:
+        data = request.get_json(force=True)
+        if not isinstance(data, dict):
+            raise ValueError('expected a JSON object')
+        beds, baths, area = (to_float(data.get(name)) for name in FEATURES)
+        if not np.isfinite([beds, baths, area]).all():
+            raise ValueError('beds, baths and area must be numbers')
+        latitude, longitude = to_float(data.get('latitude')), to_float(data.get('longitude'))
+        if not (np.isfinite(latitude) and np.isfinite(longitude)):
+            # Without coordinates, the middle of the city's listings stands in
+            place = listing_strings(None, data)
+            center = None
+            if place['locality']:
+                center = comparables.locality_center(indexes.snapshot, place['locality'],
+                                                     place['region'] or data.get('state'))
+            if center is None:
+                raise ValueError('needs latitude and longitude, or a city with listings')
+            latitude, longitude = center
+        k = comparables_k(data.get('k'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    rows, feature_distances, distances = indexes.comparables.query(latitude, longitude, beds, baths, area, k)
+    query = {'latitude': latitude, 'longitude': longitude, 'beds': beds, 'baths': baths, 'area': area}
+    return comparables_response(indexes, query, rows, feature_distances, distances)
+
+
+@app.route('/listings/<int:listing_id>/comparables', methods=['GET'])
+def listing_comparables(listing_id):
+    indexes = listing_service.current()
+    if indexes is None:
+        return listings_unavailable()
+    try:
+        k = comparables_k(request.args.get('k'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not 0 <= listing_id < indexes.snapshot.rows:
+        return jsonify({'success': False, 'error': f'no listing {listing_id}'}), 404
+    listing = indexes.snapshot.row(listing_id)
+    query = {name: listing[name] for name in ('latitude', 'longitude', 'beds', 'baths', 'area')}
+    if any(value is None for value in query.values()):
+        return jsonify({
+            'success': False,
+            'error': f'listing {listing_id} lacks coordinates, beds, baths or area'
+        }), 422
+    rows, feature_distances, distances = indexes.comparables.query(*query.values(), k, exclude=listing_id)
+    query['id'] = listing_id
+    return comparables_response(indexes, query, rows, feature_distances, distances)
+
+
+def finite_or_none(values):
+    return [value if value == value else None for value in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def point_features(longitude, latitude, properties):
+    """GeoJSON point features from coordinate arrays and property columns"""
+    names = list(properties)
+    columns = [properties[name] for name in names]
+    return [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': dict(zip(names, values))
+        }
+        for lon, lat, *values in zip(np.asarray(longitude, dtype=np.float64).tolist(),
+                                     np.asarray(latitude, dtype=np.float64).tolist(), *columns)
+    ]
+
+
+def tile_headers(response, etag, max_age):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+
+@app.route('/listings/clusters/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def listing_clusters(z, x, y):
+    """Listing clusters in map tile z/x/y as GeoJSON, or single listings at the deepest zooms"""
+    indexes = listing_service.current()
+    if indexes is None:
+        return listings_unavailable()
+    if not (0 <= z <= 24 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({'success': False, 'error': f'no tile {z}/{x}/{y}'}), 404
+    # Tiles only change with the snapshot, so a revalidation skips the work
+    etag = f'clusters-{indexes.generation}-{z}-{x}-{y}'
+    if request.if_none_match.contains(etag):
+        return tile_headers(Response(status=304), etag, LISTINGS_TILE_MAX_AGE)
+
+    found = indexes.clusters.clusters(z, x, y)
+    truncated = False
+    if found is not None:
+        single = found['row'] >= 0
+        features = point_features(found['longitude'][~single], found['latitude'][~single], {
+            'cluster': [True] * int((~single).sum()),
+            'pointCount': found['count'][~single].tolist(),
+            'priceMean': finite_or_none(found['priceMean'][~single]),
+            'priceMin': finite_or_none(found['priceMin'][~single]),
+            'priceMax': finite_or_none(found['priceMax'][~single])
+        })
+        rows = found['row'][single]
+    else:
+        # Past the deepest cluster level, a tile shows its listings one by one
+        rows, position = indexes.spatial.bbox(*clusters.tile_bounds(z, x, y), LISTINGS_MAX_LIMIT)
+        truncated = position is not None
+        features = []
+    # From the snapshot, not the float32 cluster arrays, so large prices stay exact
+    prices = indexes.snapshot.column('price')[rows]
+    features += point_features(indexes.snapshot.column('longitude')[rows],
+                               indexes.snapshot.column('latitude')[rows], {
+                                   'cluster': [False] * len(rows),
+                                   'id': np.asarray(rows).tolist(),
+                                   'price': finite_or_none(prices)
+                               })
+    return tile_headers(jsonify({
+        'type': 'FeatureCollection',
+        'features': features,
+        'truncated': truncated
+    }), etag, LISTINGS_TILE_MAX_AGE)
+
+
+@app.route('/listings/heatmap', methods=['GET'])
+def listings_heatmap():
+    """The heatmap build being served and the URL template of its tiles"""
+    heatmap = heatmap_store.current()
+    if heatmap is None:
+        return jsonify({'success': False, 'error': f'no heatmap at {HEATMAP_DIR}'}), 503
+    info = heatmap.info()
+    info['tileUrl'] = f'/listings/heatmap/{heatmap.build}/{{z}}/{{x}}/{{y}}'
+    return jsonify(info)
+
+
+@app.route('/listings/heatmap/<build>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def listings_heatmap_tile(build, z, x, y):
+    """Binary price per sq ft tile (layout in utils/heatmap.py); 204 where no listing is priced"""
+    heatmap = heatmap_store.current()
+    if heatmap is None:
+        return jsonify({'success': False, 'error': f'no heatmap at {HEATMAP_DIR}'}), 503
+    if build != heatmap.build:
+        return jsonify({
+            'success': False,
+            'error': f'heatmap build {build} was replaced by {heatmap.build}; see /listings/heatmap'
+        }), 404
+    if not (0 <= z <= heatmap.max_zoom and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({'success': False, 'error': f'no tile {z}/{x}/{y}'}), 404
+    etag = f'heatmap-{build}-{z}-{x}-{y}'
+    if request.if_none_match.contains(etag):
+        return tile_headers(Response(status=304), etag, HEATMAP_TILE_MAX_AGE)
+    payload = heatmap.tile(z, x, y)
+    response = Response(payload, mimetype='application/octet-stream') if payload else Response(status=204)
+    response = tile_headers(response, etag, HEATMAP_TILE_MAX_AGE)
+    response.headers['Cache-Control'] += ', immutable'
+    return response
+
+
+@app.route('/listings/autocomplete', methods=['GET'])
+def listings_autocomplete():
+    """City, locality and country names starting with q, most listings first"""
+    autocomplete = autocomplete_store.current()
+    if autocomplete is None:
+        return jsonify({'success': False, 'error': f'no autocomplete index at {AUTOCOMPLETE_INDEX}'}), 503
+    query = request.args.get('q', '')
+    try:
+        k = int(request.args.get('k', AUTOCOMPLETE_MAX_K))
+        if not 1 <= k <= AUTOCOMPLETE_MAX_K:
+            raise ValueError(f'k must be between 1 and {AUTOCOMPLETE_MAX_K}')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'query': query, 'completions': autocomplete.complete(query, k)})
+
+
+@app.route('/listings/snapshot', methods=['GET'])
+def listings_snapshot():
+    indexes = listing_service.current()
+    if indexes is None:
+        return listings_unavailable()
+    return jsonify(indexes.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    handle = registry.current
+    return jsonify({
+        'ready': handle is not None,
+        'modelVersion': handle.version if handle is not None else None,
+        'secondsToReady': seconds_to_ready
+    }), 200 if handle is not None else 503
+
+
+@app.route('/model', methods=['GET'])
+def model_status():
+    return jsonify(registry.status())
+
+
+@app.route('/model/shards', methods=['GET'])
+def model_shards():
+    return jsonify(shard_router.stats())
+
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    denied = admin_error()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    try:
+        # Fail fast on unknown versions; the pin reaches the other workers
+        # through their model watchers, this one loads in the background
+        registry.pin(version)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    registry.reload_in_background()
+    return jsonify({
+        'success': True,
+        'servingVersion': registry.current.version if registry.current is not None else None,
+        'loading': version or 'latest',
+        'pinned': version
+    }), 202
+
+
+@app.route('/admin/profile/sample', methods=['POST'])
+def admin_profile_sample():
+    """Start sampling every thread of this process for ?seconds=N; fetch the stacks from /admin/profile/<id>"""
+    denied = admin_error()
+    if denied:
+        return denied
+    seconds = request.args.get('seconds', 10.0, type=float)
+    interval_ms = request.args.get('intervalMs', 5.0, type=float)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or interval_ms <= 0:
+        return jsonify({
+            'success': False,
+            'error': f'seconds must be in (0, {PROFILE_MAX_SECONDS:g}] and intervalMs positive'
+        }), 400
+    # Sampling on this thread would block a single-threaded worker for the
+    # whole window, and the sample would never see a request being handled
+    profile_id = profile_store.start_sample(seconds, interval_ms / 1000.0)
+    if profile_id is None:
+        return jsonify({
+            'success': False,
+            'error': f'profile {profile_store.sampling()} is still being sampled in worker {os.getpid()}'
+        }), 409
+    return jsonify({
+        'success': True,
+        'profileId': profile_id,
+        'seconds': seconds,
+        'resultUrl': f'/admin/profile/{profile_id}'
+    }), 202, {'X-Profile-Pid': str(os.getpid()), 'Retry-After': str(math.ceil(seconds))}
+
+
+@app.route('/admin/profile/<profile_id>', methods=['GET'])
+def admin_profile(profile_id):
+    denied = admin_error()
+    if denied:
+        return denied
+    counts = profile_store.get(profile_id)
+    if counts is None and profile_store.sampling() == profile_id:
+        return jsonify({'success': False, 'error': f'profile {profile_id} is still being sampled'}), 202
+    if counts is None:
+        # Profiles live in the worker that served the request
+        return jsonify({
+            'success': False,
+            'error': f'no profile {profile_id} in worker {os.getpid()}'
+        }), 404
+    return Response(profiling.folded(counts), mimetype='text/plain')
+
+
 if __name__ == '__main__':
+    start_background_tasks()
     app.run(port=5000)
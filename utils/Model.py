@@ -1,8 +1,15 @@
+import json
+import os
+from datetime import datetime, timezone
+
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from xgboost import XGBRegressor
 import joblib
 
+from artifacts import write_version_stamp
+from sketches import build_reference
+
 # Load the data from the CSV file
 data = pd.read_csv("./selected_house_data.csv")
 
@@ -27,6 +34,42 @@ print("Training the model...")
 model.fit(X_train, y_train)
 print("Model training completed.")
 
-# Save the trained model
+# One version for everything this run writes, so the .pkl, the .ubj and a
+# prediction grid built from either all name the same model
+version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+# Save the trained model, with its native export next to it for fast starts
 joblib.dump(model, 'house_price_prediction_model.pkl')
-print("Model saved as house_price_prediction_model.pkl.")
+model.get_booster().save_model('house_price_prediction_model.ubj')
+write_version_stamp(version, ['house_price_prediction_model.pkl', 'house_price_prediction_model.ubj'])
+print(f"Model version {version} saved as house_price_prediction_model.pkl and .ubj.")
+
+# Save a versioned copy for the server to pick up without a restart. It is
+# written under a temporary name and renamed so the watcher never sees a
+# partially written file.
+os.makedirs('models', exist_ok=True)
+artifact = os.path.join('models', f'house_price_model-{version}.pkl')
+joblib.dump(model, artifact + '.tmp')
+os.replace(artifact + '.tmp', artifact)
+print(f"Model version {version} saved as {artifact}.")
+
+# Native XGBoost format of the same version, which loads much faster than the
+# pickle. The extension picks the format, so the temporary name keeps .ubj.
+native = os.path.join('models', f'house_price_model-{version}.ubj')
+model.get_booster().save_model(native + '.partial.ubj')
+os.replace(native + '.partial.ubj', native)
+print(f"Model version {version} saved as {native}.")
+
+# Distributions of the training inputs and of the model's predictions on them,
+# which the server compares live /predict traffic against
+reference = build_reference({
+    'beds': X_train['beds'].to_numpy(dtype=float),
+    'baths': X_train['baths'].to_numpy(dtype=float),
+    'area': X_train['area'].to_numpy(dtype=float),
+    'price': model.predict(X_train),
+})
+for path in ('reference_sketch.json', os.path.join('models', f'house_price_model-{version}.sketch.json')):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(reference, f)
+    os.replace(path + '.tmp', path)
+print(f"Reference input sketch saved for model version {version}.")
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+
+
+def file_version(path):
+    """Short content hash used to tell model artifacts apart"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def version_stamp_path(path):
+    """Stamp shared by the artifacts of one stem, e.g. model.pkl and model.ubj -> model.version.json"""
+    return os.path.splitext(path)[0] + '.version.json'
+
+
+def write_version_stamp(version, paths):
+    """Record that the artifacts at paths are one model version
+
+    A .pkl and the .ubj exported from it hash differently, so without a
+    stamp they would count as two versions. Each file's content hash is
+    kept too, so an artifact replaced later no longer matches its stamp.
+    """
+    stamps = {}
+    for path in paths:
+        stamps.setdefault(version_stamp_path(path), {})[os.path.basename(path)] = file_version(path)
+    for stamp_path, files in stamps.items():
+        with open(stamp_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'files': files}, f, indent=2)
+        os.replace(stamp_path + '.tmp', stamp_path)
+
+
+def stamped_version(path):
+    """Version stamped on an unchanged artifact, else None"""
+    try:
+        with open(version_stamp_path(path), 'r', encoding='utf-8') as f:
+            stamp = json.load(f)
+        expected = stamp['files'][os.path.basename(path)]
+        version = stamp['version']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return version if file_version(path) == expected else None
@@ -0,0 +1,187 @@
+import numpy as np
+
+NUMERIC_ATTRIBUTES = ('price', 'beds', 'baths', 'area')
+CATEGORICAL_ATTRIBUTES = ('source',)
+
+# A filter matching at most this fraction of the listings is evaluated from
+# its own rows; broader filters are intersected as bitmaps
+CANDIDATE_FRACTION = 1 / 8
+
+
+class _Sequence:
+    """One sort order over every row: rows in order, and each row's position in it"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.rank = np.empty(len(rows), dtype=np.int64)
+        self.rank[rows] = np.arange(len(rows))
+
+
+class AttributeIndex:
+    """Sorted arrays per numeric attribute plus bitmaps per categorical value
+
+    A range filter is a binary search on the attribute's sorted values,
+    which yields its matching rows as one slice of the sort permutation.
+    Categorical values have precomputed bitmaps. Selective queries start
+    from the rows of their narrowest filter and check the rest by lookup;
+    broad ones AND the filters together as bitmaps and walk the requested
+    sort order until the page is full. Either way no query scans every row.
+
+    Pages are keyed by the position of their last row in the sort order.
+    A snapshot never changes, so that position is a stable keyset.
+    """
+
+    def __init__(self, snapshot, numeric=NUMERIC_ATTRIBUTES, categorical=CATEGORICAL_ATTRIBUTES):
+        self.rows = snapshot.rows
+        self.values = {}
+        self.order = {}
+        self.sorted_values = {}
+        for name in numeric:
+            values = np.asarray(snapshot.column(name), dtype=np.float64)
+            # NaN sorts last, so the missing values trail every slice
+            order = np.argsort(values, kind='stable')
+            self.values[name] = values
+            self.order[name] = order
+            self.sorted_values[name] = values[order][:int(np.isfinite(values).sum())]
+
+        self.codes = {}
+        self.bitmaps = {}
+        self.members = {}
+        self.folded = {}
+        for name in categorical:
+            codes = np.asarray(snapshot.column(name), dtype=np.int32)
+            self.codes[name] = codes
+            self.bitmaps[name] = {}
+            self.members[name] = {}
+            # Values differing only in case are one value to a filter
+            self.folded[name] = {}
+            strings = snapshot.dictionary(name)
+            for code, value in enumerate(strings.values(np.arange(len(strings)))):
+                self.folded[name].setdefault(value.casefold(), []).append(code)
+            for code in np.unique(codes[codes >= 0]).tolist():
+                bitmap = codes == code
+                self.bitmaps[name][code] = bitmap
+                self.members[name][code] = np.flatnonzero(bitmap)
+
+        self._sequences = {}
+
+    def category_codes(self, name, values):
+        """Codes of a categorical attribute matching any of values, ignoring case"""
+        return [code for value in values for code in self.folded[name].get(value.strip().casefold(), [])]
+
+    def sequence(self, sort, descending=False):
+        """Rows in sort order; listings missing the sort attribute come last either way"""
+        key = (sort, descending)
+        sequence = self._sequences.get(key)
+        if sequence is None:
+            if sort == 'id':
+                rows = np.arange(self.rows, dtype=np.int64)
+                if descending:
+                    rows = rows[::-1].copy()
+            else:
+                order = self.order[sort]
+                present = len(self.sorted_values[sort])
+                rows = np.concatenate([order[:present][::-1], order[present:]]) if descending else order
+            sequence = self._sequences[key] = _Sequence(rows)
+        return sequence
+
+    def _range(self, name, low, high):
+        """Slice of order[name] holding the rows with low <= value <= high"""
+        values = self.sorted_values[name]
+        start = 0 if low is None else int(np.searchsorted(values, low, side='left'))
+        stop = len(values) if high is None else int(np.searchsorted(values, high, side='right'))
+        return start, max(start, stop)
+
+    def search(self, ranges=None, categories=None, sort='id', descending=False, limit=50, after=-1):
+        """Rows matching every filter, in sort order after position `after`
+
+        ranges maps numeric attributes to (low, high), either end None for
+        unbounded; categories maps categorical attributes to the codes
+        allowed. Returns (rows, total matches, position of the last row or
+        None when it is the last page).
+        """
+        ranges = ranges or {}
+        slices = {name: self._range(name, low, high) for name, (low, high) in ranges.items()}
+        allowed = {name: [code for code in codes if code in self.bitmaps[name]]
+                   for name, codes in (categories or {}).items()}
+
+        sizes = [(stop - start, 'range', name) for name, (start, stop) in slices.items()]
+        sizes += [(sum(len(self.members[name][code]) for code in codes), 'category', name)
+                  for name, codes in allowed.items()]
+        sequence = self.sequence(sort, descending)
+        if not sizes:
+            matches = None
+        else:
+            size, kind, narrowest = min(sizes)
+            if size == 0:
+                return np.empty(0, dtype=np.int64), 0, None
+            if size <= self.rows * CANDIDATE_FRACTION:
+                return self._search_candidates(ranges, slices, allowed, kind, narrowest, sequence, limit, after)
+            matches = self._bitmap(slices, allowed)
+        return self._walk(matches, sequence, limit, after)
+
+    def _search_candidates(self, ranges, slices, allowed, kind, narrowest, sequence, limit, after):
+        if kind == 'range':
+            start, stop = slices[narrowest]
+            rows = self.order[narrowest][start:stop]
+        else:
+            rows = np.concatenate([self.members[narrowest][code] for code in allowed[narrowest]])
+        for name, (low, high) in ranges.items():
+            if kind == 'range' and name == narrowest:
+                continue
+            values = self.values[name][rows]
+            keep = np.isfinite(values)
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values <= high
+            rows = rows[keep]
+        for name, codes in allowed.items():
+            if kind == 'category' and name == narrowest:
+                continue
+            rows = rows[np.isin(self.codes[name][rows], codes)]
+
+        total = len(rows)
+        positions = sequence.rank[rows]
+        positions = positions[positions > after]
+        if len(positions) > limit + 1:
+            positions = np.partition(positions, limit)[:limit + 1]
+        positions.sort()
+        more = len(positions) > limit
+        positions = positions[:limit]
+        return sequence.rows[positions], total, int(positions[-1]) if more else None
+
+    def _bitmap(self, slices, allowed):
+        matches = None
+        for name, codes in allowed.items():
+            bitmap = np.zeros(self.rows, dtype=bool)
+            for code in codes:
+                bitmap |= self.bitmaps[name][code]
+            matches = bitmap if matches is None else matches & bitmap
+        for name, (start, stop) in slices.items():
+            bitmap = np.zeros(self.rows, dtype=bool)
+            bitmap[self.order[name][start:stop]] = True
+            matches = bitmap if matches is None else matches & bitmap
+        return matches
+
+    def _walk(self, matches, sequence, limit, after):
+        start = after + 1
+        if matches is None:
+            total = self.rows
+            positions = np.arange(start, min(start + limit + 1, self.rows))
+        else:
+            total = int(np.count_nonzero(matches))
+            # Read ahead in proportion to how rare a match is
+            step = max(4 * (limit + 1), int((limit + 1) * self.rows / max(total, 1) * 1.5))
+            found = []
+            count = 0
+            while start < self.rows and count <= limit:
+                chunk = np.arange(start, min(start + step, self.rows))
+                chunk = chunk[matches[sequence.rows[chunk]]]
+                found.append(chunk)
+                count += len(chunk)
+                start += step
+            positions = np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+        more = len(positions) > limit
+        positions = positions[:limit]
+        return sequence.rows[positions], total, int(positions[-1]) if more else None
@@ -0,0 +1,235 @@
+import argparse
+import bisect
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import unicodedata
+
+import numpy as np
+
+from utils.snapshot import ReopeningDirectory, Snapshot, StringDictionary, replace_directory, write_strings
+
+FORMAT_VERSION = 1
+
+# Completions kept per prefix, and the most a query may ask for
+TOP_K = 10
+
+# Prefixes matching more keys than this get their top completions
+# precomputed; narrower ones are ranked at query time
+PRECOMPUTE_ABOVE = 32
+
+KINDS = ['city', 'locality', 'country']
+
+STATE_DATA_PATH = './script/state_data.json'
+
+NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text, prefix=False):
+    """Lower-case ASCII words of a name, so "São Paulo" and "sao-paulo" look alike
+
+    For a typed prefix a trailing separator is kept, so "new " does not
+    complete to "Newark".
+    """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    words = NON_ALPHANUMERIC.sub(' ', text).split()
+    normalized = ' '.join(words)
+    if prefix and normalized and NON_ALPHANUMERIC.match(text[-1:]):
+        normalized += ' '
+    return normalized
+
+
+def index_keys(name):
+    """Keys a name is found under: the whole name, and from every later word of the place itself
+
+    "San Diego, CA" is found by "san" and "diego" but not by "ca", which
+    would otherwise match every city of the state.
+    """
+    words = normalize(name).split()
+    place = len(normalize(name.split(',')[0]).split())
+    return [' '.join(words[i:]) for i in range(max(place, 1))]
+
+
+def collect_names(snapshot=None, state_data_path=STATE_DATA_PATH):
+    """{normalized name: [display name, kind, listing count]} of every known place"""
+    names = {}
+
+    def add(name, kind, count):
+        key = normalize(name)
+        if not key:
+            return
+        entry = names.get(key)
+        if entry is None:
+            names[key] = [name, kind, count]
+        else:
+            entry[2] += count
+
+    if state_data_path and os.path.exists(state_data_path):
+        with open(state_data_path, 'r', encoding='utf-8') as f:
+            states = json.load(f)
+        for state in states.values():
+            for city in state.get('cities', []):
+                if city.get('city'):
+                    add(city['city'], 'city', 0)
+
+    if snapshot is not None and snapshot.rows:
+        codes = {name: np.asarray(snapshot.column(name), dtype=np.int64) for name in ('locality', 'region', 'country')}
+        places, counts = np.unique(np.column_stack([codes['locality'], codes['region'], codes['country']]),
+                                   axis=0, return_counts=True)
+        localities, regions, countries = (snapshot.dictionary(name) for name in ('locality', 'region', 'country'))
+        for (locality, region, country), count in zip(places.tolist(), counts.tolist()):
+            if locality < 0:
+                continue
+            # Listings of a known "City, ST" add to its count
+            qualifier = regions[region] or countries[country]
+            add(f'{localities[locality]}, {qualifier}' if qualifier else localities[locality], 'locality', count)
+        country_codes, counts = np.unique(codes['country'], return_counts=True)
+        for country, count in zip(country_codes.tolist(), counts.tolist()):
+            if country >= 0:
+                add(countries[country], 'country', count)
+    return names
+
+
+def build_autocomplete(out, snapshot_path=None, state_data_path=STATE_DATA_PATH, top_k=TOP_K):
+    """Write the prefix index of every known place name to the directory `out`
+
+    Keys are sorted, so the keys starting with a prefix are one range found
+    by binary search. Ranges wider than PRECOMPUTE_ABOVE have their top_k
+    completions by listing count stored, found by descending the sorted
+    keys one character at a time.
+    """
+    snapshot = Snapshot(snapshot_path) if snapshot_path and os.path.exists(snapshot_path) else None
+    names = collect_names(snapshot, state_data_path)
+    entries = sorted(names.values(), key=lambda entry: (-entry[2], entry[0]))
+    # Entries are numbered by rank, so the smallest ids in a range are its best
+    pairs = sorted((key, rank) for rank, entry in enumerate(entries) for key in index_keys(entry[0]))
+    keys = [key for key, _ in pairs]
+    ranks = np.array([rank for _, rank in pairs], dtype=np.int32)
+
+    prefixes = []
+    top = []
+
+    def descend(start, stop, depth):
+        if stop - start <= PRECOMPUTE_ABOVE:
+            return
+        prefixes.append(keys[start][:depth])
+        best = np.unique(ranks[start:stop])[:top_k]
+        top.append(np.pad(best, (0, top_k - len(best)), constant_values=-1))
+        # Keys ending at this depth sort first; then one range per next character
+        position = bisect.bisect_right(keys, keys[start][:depth], start, stop)
+        while position < stop:
+            char = keys[position][depth]
+            end = bisect.bisect_left(keys, keys[position][:depth] + chr(ord(char) + 1), position, stop)
+            descend(position, end, depth + 1)
+            position = end
+
+    descend(0, len(keys), 0)
+
+    staging = out.rstrip('/') + '.building'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    write_strings(staging, 'keys', keys)
+    np.save(os.path.join(staging, 'key_ranks.npy'), ranks)
+    write_strings(staging, 'names', [entry[0] for entry in entries])
+    np.save(os.path.join(staging, 'kinds.npy'), np.array([KINDS.index(entry[1]) for entry in entries], dtype=np.int8))
+    np.save(os.path.join(staging, 'counts.npy'), np.array([entry[2] for entry in entries], dtype=np.int64))
+    write_strings(staging, 'prefixes', prefixes)
+    np.save(os.path.join(staging, 'top.npy'), np.array(top, dtype=np.int32).reshape(len(top), top_k))
+    meta = {
+        'formatVersion': FORMAT_VERSION,
+        'builtAt': time.time(),
+        'snapshotBuiltAt': snapshot.meta['builtAt'] if snapshot is not None else None,
+        'names': len(entries),
+        'keys': len(keys),
+        'precomputedPrefixes': len(prefixes),
+        'topK': top_k
+    }
+    with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    replace_directory(staging, out)
+    return meta
+
+
+class Autocomplete:
+    """Read side of an autocomplete directory
+
+    Arrays are memory-mapped; the sorted keys and prefixes are decoded into
+    lists once on open, so the binary searches of a query run on str.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['formatVersion'] != FORMAT_VERSION:
+            raise ValueError(f"unsupported autocomplete format {self.meta['formatVersion']}")
+        self.top_k = self.meta['topK']
+        self.keys = self._strings('keys')
+        self.key_ranks = self._load('key_ranks.npy')
+        self.names = self._strings('names')
+        self.kinds = self._load('kinds.npy')
+        self.counts = self._load('counts.npy')
+        self.prefixes = self._strings('prefixes')
+        self.top = self._load('top.npy')
+
+    def _load(self, filename):
+        return np.load(os.path.join(self.path, filename), mmap_mode='r')
+
+    def _strings(self, name):
+        strings = StringDictionary(self._load(f'{name}.dict.npy'), self._load(f'{name}.offsets.npy'))
+        return strings.values(np.arange(len(strings)))
+
+    def complete(self, text, k=TOP_K):
+        """Up to k place names starting with text (or with one of its later words), most listings first"""
+        prefix = normalize(text, prefix=True)
+        k = min(k, self.top_k)
+        found = bisect.bisect_left(self.prefixes, prefix)
+        if found < len(self.prefixes) and self.prefixes[found] == prefix:
+            ranks = self.top[found]
+            ranks = ranks[ranks >= 0][:k]
+        else:
+            # Too few keys start with this prefix to have been precomputed
+            start = bisect.bisect_left(self.keys, prefix)
+            stop = bisect.bisect_left(self.keys, prefix + '\uffff', start)
+            ranks = np.unique(self.key_ranks[start:stop])[:k]
+        return [
+            {'name': self.names[rank], 'kind': KINDS[self.kinds[rank]], 'listings': int(self.counts[rank])}
+            for rank in ranks.tolist()
+        ]
+
+
+class AutocompleteStore(ReopeningDirectory):
+    def __init__(self, path, check_interval=5.0):
+        super().__init__(path, Autocomplete, check_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Place name autocomplete index')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='index state_data.json cities and the snapshot\'s places')
+    build.add_argument('--snapshot', default='./utils/listings_snapshot')
+    build.add_argument('--states', default=STATE_DATA_PATH)
+    build.add_argument('--out', default='./utils/autocomplete_index')
+    complete = commands.add_parser('complete', help='try a prefix')
+    complete.add_argument('prefix')
+    complete.add_argument('--index', default='./utils/autocomplete_index')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        started = time.perf_counter()
+        meta = build_autocomplete(args.out, args.snapshot, args.states)
+        if not meta['names']:
+            sys.exit('No place names found; build the listing snapshot or pass --states')
+        print(f"Autocomplete of {meta['names']} names ({meta['precomputedPrefixes']} prefixes precomputed) "
+              f"written to {args.out} in {time.perf_counter() - started:.2f}s")
+    elif args.command == 'complete':
+        for completion in Autocomplete(args.index).complete(args.prefix):
+            print(f"{completion['name']}  ({completion['kind']}, {completion['listings']} listings)")
+
+
+if __name__ == '__main__':
+    main()
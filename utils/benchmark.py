@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+
+# Run against the live model, not the prediction cache, and without the
+# threads a serving process would start
+os.environ.setdefault('PREDICT_CACHE_SIZE', '0')
+os.environ.setdefault('MODEL_WATCH_INTERVAL', '0')
+os.environ['PREDICT_CAPTURE_DIR'] = ''
+
+DEFAULT_ROWS = [1, 100, 10000]
+
+
+def sample_records(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {'beds': int(beds), 'baths': float(baths), 'area': int(area)}
+        for beds, baths, area in zip(rng.integers(1, 7, n_rows),
+                                     rng.integers(2, 9, n_rows) / 2.0,
+                                     rng.integers(500, 5000, n_rows))
+    ]
+
+
+def measure(fn, min_time=0.2, repeat=5):
+    """Per-call time (median and best of `repeat` runs) and peak bytes allocated by one call"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    runs = [elapsed / number for elapsed in timer.repeat(repeat, number)]
+
+    tracemalloc.start()
+    try:
+        fn()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        fn()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'medianUs': float(np.median(runs)) * 1e6,
+        'minUs': min(runs) * 1e6,
+        'calls': number * repeat,
+        'peakBytes': peak - before,
+        'retainedBytes': after - before
+    }
+
+
+def cases(server, rows_list):
+    """(name, fn) for every stage of the predict path and each request size"""
+    from utils.inference import BACKENDS, FEATURES
+
+    handle = server.registry.current
+    backends = []
+    for cls in BACKENDS.values():
+        try:
+            backends.append(cls(handle.model))
+        except Exception:
+            # e.g. sklearn needs the pickled XGBRegressor, not a native file
+            continue
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+    client = server.app.test_client()
+
+    for n_rows in rows_list:
+        records = sample_records(n_rows)
+        if n_rows == 1:
+            payload = records[0]
+            body = json.dumps(payload).encode()
+            matrix = np.array([server.normalize_key(payload['beds'], payload['baths'], payload['area'])])
+            yield 'json_parse', n_rows, lambda body=body: json.loads(body)
+            yield 'coerce', n_rows, lambda p=payload: server.normalize_key(p['beds'], p['baths'], p['area'])
+        else:
+            body = json.dumps(records).encode()
+            matrix, _, _ = server.parse_batch(records)
+            yield 'json_parse', n_rows, lambda body=body: json.loads(body)
+            yield 'coerce', n_rows, lambda records=records: server.parse_batch(records)
+
+        if pd is not None:
+            yield 'dataframe', n_rows, lambda matrix=matrix: pd.DataFrame(matrix, columns=FEATURES)
+        for backend in backends:
+            yield f'predict.{backend.name}', n_rows, lambda backend=backend, matrix=matrix: backend.predict(matrix)
+
+        prices = handle.backend.predict(matrix).tolist()
+        if n_rows == 1:
+            document = {'success': True, 'predictedPrice': prices[0], 'modelVersion': handle.version}
+        else:
+            document = {'success': True, 'count': n_rows, 'predictedPrices': prices,
+                        'errors': [], 'modelVersion': handle.version}
+
+        def serialize(document=document):
+            with server.app.app_context():
+                return server.jsonify(document)
+
+        yield 'jsonify', n_rows, serialize
+
+        path = '/predict' if n_rows == 1 else '/predict/batch'
+        yield f'e2e{path}', n_rows, lambda path=path, body=body: client.post(
+            path, data=body, content_type='application/json')
+
+
+def run(rows_list, min_time=0.2, repeat=5, name_filter=None):
+    import server
+
+    if server.registry.current is None:
+        server.registry.reload()
+    handle = server.registry.current
+    results = {}
+    for stage, n_rows, fn in cases(server, rows_list):
+        name = f'{stage}[{n_rows}]'
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(fn, min_time, repeat)
+        result = results[name]
+        print(f"{name:28s} {result['medianUs']:12.1f} us  {result['peakBytes']:>12,d} B peak",
+              file=sys.stderr)
+
+    from importlib.metadata import version
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'flask': version('flask'),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'modelVersion': handle.version,
+            'backend': handle.backend.name
+        },
+        'results': results
+    }
+
+
+def compare(baseline, current, threshold=0.1, min_bytes=1024):
+    """Regressions of current against baseline, as (name, metric, before, after) tuples
+
+    Time regresses when the median grows by more than `threshold`, memory
+    when peak bytes grow by more than `threshold` and at least min_bytes.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        if result['medianUs'] > before['medianUs'] * (1 + threshold):
+            regressions.append((name, 'medianUs', before['medianUs'], result['medianUs']))
+        grown = result['peakBytes'] - before['peakBytes']
+        if grown > min_bytes and result['peakBytes'] > before['peakBytes'] * (1 + threshold):
+            regressions.append((name, 'peakBytes', before['peakBytes'], result['peakBytes']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the /predict hot path')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS,
+                        help='request sizes; 1 runs the /predict path, larger ones /predict/batch')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per timing run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--filter', default=None, help='only run benchmarks whose name contains this')
+    parser.add_argument('--save', default=None, help='write the results to this baseline file')
+    parser.add_argument('--compare', default=None, help='baseline file to check the results against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown or memory growth reported as a regression')
+    args = parser.parse_args()
+
+    current = run(args.rows, args.min_time, args.repeat, args.filter)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline saved to {args.save}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for name, metric, before, after in regressions:
+            change = f'{(after / before - 1) * 100:+.0f}%' if before else 'new'
+            print(f"REGRESSION {name} {metric}: {before:,.1f} -> {after:,.1f} ({change})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    elif not args.save:
+        print(json.dumps(current, indent=2))
+
+
+if __name__ == '__main__':
+    main()
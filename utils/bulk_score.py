@@ -0,0 +1,104 @@
+import argparse
+import io
+import json
+import sys
+
+import numpy as np
+
+from utils.listings import iter_listings, normalize_listing
+
+DEFAULT_CHUNK_ROWS = 5000
+
+
+def _chunks(listings, size):
+    chunk = []
+    for listing in listings:
+        chunk.append(listing)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def score_listings(listings, predict_fn, chunk_rows=DEFAULT_CHUNK_ROWS, full=False):
+    """Yield one scored result per listing, scoring chunk_rows listings per model call
+
+    Each result carries the normalized features, the listed price, the
+    predicted price and valuationRatio = listed / predicted (above 1 means
+    the listing is priced over the model's estimate).
+    """
+    for chunk in _chunks(listings, chunk_rows):
+        normalized = [normalize_listing(listing) if isinstance(listing, dict) else (None,) * 4
+                      for listing in chunk]
+        matrix = np.array([row[:3] for row in normalized], dtype=np.float64)
+        valid = np.isfinite(matrix).all(axis=1)
+
+        predictions = np.full(len(chunk), np.nan)
+        if valid.any():
+            predictions[valid] = predict_fn(matrix[valid])
+
+        for listing, (beds, baths, area, price), ok, predicted in zip(
+                chunk, normalized, valid.tolist(), predictions.tolist()):
+            if not isinstance(listing, dict):
+                result = {}
+            elif full:
+                result = dict(listing)
+            else:
+                result = {'home_url': listing.get('home_url')}
+            result.update({
+                'beds': beds,
+                'baths': baths,
+                'area': area,
+                'price': price,
+                'predictedPrice': predicted if ok else None,
+                'valuationRatio': price / predicted
+                if ok and price is not None and predicted > 0 else None
+            })
+            if not ok:
+                result['error'] = 'missing or unparsable beds, baths or area'
+            yield result
+
+
+def to_ndjson(results):
+    for result in results:
+        yield json.dumps(result) + '\n'
+
+
+def main():
+    from utils.model_registry import ModelRegistry
+
+    parser = argparse.ArgumentParser(description='Attach model predictions to scraped listings')
+    parser.add_argument('inputs', nargs='*', default=['-'],
+                        help='NDJSON or JSON array files from the scrapers (default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='NDJSON output file (default: stdout)')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--full', action='store_true', help='include every field of the original listing')
+    parser.add_argument('--model-dir', default='./utils/models')
+    parser.add_argument('--model', default='./utils/house_price_prediction_model.pkl')
+    parser.add_argument('--backend', default='auto')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.model_dir, args.model, args.backend)
+    backend = registry.reload().backend
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    scored = 0
+    try:
+        for path in args.inputs:
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8') if path == '-' \
+                else open(path, 'r', encoding='utf-8')
+            with stream:
+                results = score_listings(iter_listings(stream), backend.predict,
+                                         args.chunk_rows, args.full)
+                for line in to_ndjson(results):
+                    out.write(line)
+                    scored += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Scored {scored} listings", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
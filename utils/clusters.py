@@ -0,0 +1,160 @@
+import math
+
+import numpy as np
+
+# Web Mercator stops at the latitude where the map becomes square
+MAX_LATITUDE = 85.05112878
+
+# Each tile is split into 2**CELL_BITS x 2**CELL_BITS cluster cells, 32
+# pixels wide on a 256 pixel tile
+CELL_BITS = 3
+
+
+def mercator(latitude, longitude):
+    """Web Mercator x and y as fractions of the world, y growing southwards like tile rows"""
+    latitude = np.clip(np.asarray(latitude, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    x = (np.asarray(longitude, dtype=np.float64) + 180) / 360
+    sin = np.sin(np.radians(latitude))
+    y = 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return x, y
+
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) in degrees of tile z/x/y"""
+    n = 2 ** z
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return latitude(y + 1), x / n * 360 - 180, latitude(y), (x + 1) / n * 360 - 180
+
+
+def tile_keys(zoom, cell_x, cell_y, cell_bits=CELL_BITS):
+    """Sort keys placing the cells of one tile next to each other
+
+    The high bits are the tile, x << zoom | y, and the low 2 * cell_bits
+    bits the cell within it.
+    """
+    mask = (1 << cell_bits) - 1
+    tile = ((cell_x >> cell_bits) << zoom) | (cell_y >> cell_bits)
+    return (tile << (2 * cell_bits)) | ((cell_x & mask) << cell_bits) | (cell_y & mask)
+
+
+class _Cells:
+    """Running sums of the listings in each cell of one zoom level, used while building"""
+
+    def __init__(self, zoom, cell_x, cell_y, count, latitude_sum, longitude_sum,
+                 price_sum, priced, price_min, price_max, row):
+        self.zoom = zoom
+        self.cell_x = cell_x
+        self.cell_y = cell_y
+        self.count = count
+        self.latitude_sum = latitude_sum
+        self.longitude_sum = longitude_sum
+        self.price_sum = price_sum
+        self.priced = priced
+        self.price_min = price_min
+        self.price_max = price_max
+        self.row = row
+
+    def group(self, zoom):
+        """Cells of `zoom` (this level or a coarser one), merging the ones that fall together"""
+        shift = self.zoom - zoom
+        cell_x, cell_y = self.cell_x >> shift, self.cell_y >> shift
+        key = tile_keys(zoom, cell_x, cell_y)
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        starts = np.flatnonzero(np.concatenate([[True], key[1:] != key[:-1]]))
+
+        def reduce(ufunc, values):
+            return ufunc.reduceat(values[order], starts)
+
+        count = reduce(np.add, self.count)
+        row = self.row[order][starts]
+        row[count > 1] = -1
+        return _Cells(zoom, cell_x[order][starts], cell_y[order][starts], count,
+                      reduce(np.add, self.latitude_sum), reduce(np.add, self.longitude_sum),
+                      reduce(np.add, self.price_sum), reduce(np.add, self.priced),
+                      reduce(np.fmin, self.price_min), reduce(np.fmax, self.price_max), row)
+
+
+class _Level:
+    """Finished clusters of one zoom level, sorted by tile and then cell"""
+
+    def __init__(self, cells):
+        self.key = tile_keys(cells.zoom, cells.cell_x, cells.cell_y)
+        self.count = cells.count.astype(np.int32)
+        self.latitude = (cells.latitude_sum / cells.count).astype(np.float32)
+        self.longitude = (cells.longitude_sum / cells.count).astype(np.float32)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.price_mean = np.where(cells.priced > 0, cells.price_sum / cells.priced, np.nan).astype(np.float32)
+        self.price_min = cells.price_min.astype(np.float32)
+        self.price_max = cells.price_max.astype(np.float32)
+        self.row = cells.row.astype(np.int32)
+
+    def __len__(self):
+        return len(self.key)
+
+
+class ClusterPyramid:
+    """Listing clusters for every zoom level up to max_zoom, served by map tile
+
+    At zoom z the world is cut into 2**(z + CELL_BITS) cells per side and
+    the listings of each cell form one cluster with a count, a centroid and
+    price aggregates, like a geohash pyramid. The deepest level groups the
+    listings themselves; every level above merges the four child cells of
+    each parent, so the whole pyramid is built with a handful of sorts.
+    A tile's clusters are one contiguous slice of its level. Above
+    max_zoom a tile holds few enough listings to show them individually.
+    """
+
+    def __init__(self, latitude, longitude, price, max_zoom=12):
+        self.max_zoom = max_zoom
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        price = np.asarray(price, dtype=np.float64)
+        rows = np.flatnonzero(np.isfinite(latitude) & np.isfinite(longitude)
+                              & (np.abs(latitude) <= 90) & (np.abs(longitude) <= 180))
+        latitude, longitude, price = latitude[rows], longitude[rows], price[rows]
+        x, y = mercator(latitude, longitude)
+        scale = 1 << (max_zoom + CELL_BITS)
+        cell_x = np.minimum((x * scale).astype(np.int64), scale - 1)
+        cell_y = np.minimum((y * scale).astype(np.int64), scale - 1)
+        priced = np.isfinite(price)
+        if not len(rows):
+            self.levels = []
+            return
+
+        cells = _Cells(max_zoom, cell_x, cell_y, np.ones(len(rows), dtype=np.int64), latitude, longitude,
+                       np.where(priced, price, 0.0), priced.astype(np.int64), price, price, rows)
+        levels = []
+        for zoom in range(max_zoom, -1, -1):
+            cells = cells.group(zoom)
+            levels.append(_Level(cells))
+        self.levels = levels[::-1]
+
+    def clusters(self, z, x, y):
+        """Clusters in tile z/x/y as a dict of arrays, or None above max_zoom"""
+        if z > self.max_zoom:
+            return None
+        if not self.levels:
+            # Same dtypes as a level's arrays; rows index snapshot columns
+            empty = {name: np.empty(0, dtype=np.float32)
+                     for name in ('latitude', 'longitude', 'priceMean', 'priceMin', 'priceMax')}
+            empty.update(count=np.empty(0, dtype=np.int32), row=np.empty(0, dtype=np.int32))
+            return empty
+        level = self.levels[z]
+        tile = (x << z) | y
+        start, stop = np.searchsorted(level.key, [tile << (2 * CELL_BITS), (tile + 1) << (2 * CELL_BITS)])
+        return {
+            'count': level.count[start:stop],
+            'latitude': level.latitude[start:stop],
+            'longitude': level.longitude[start:stop],
+            'priceMean': level.price_mean[start:stop],
+            'priceMin': level.price_min[start:stop],
+            'priceMax': level.price_max[start:stop],
+            'row': level.row[start:stop]
+        }
+
+    def stats(self):
+        return {'maxZoom': self.max_zoom, 'clustersPerZoom': [len(level) for level in self.levels]}
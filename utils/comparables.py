@@ -0,0 +1,101 @@
+import math
+
+import numpy as np
+
+from utils.spatial import EARTH_RADIUS_KM, haversine_km
+
+# How many kilometres away a home may be before it counts as less similar
+# than one unit of difference in each feature
+FEATURE_KM = {'beds': 1.5, 'baths': 1.5, 'area': 1.5 / 250}
+
+
+def _earth_points(latitude, longitude):
+    """Earth-centred coordinates in km; chord length approximates great-circle distance nearby"""
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)]) * EARTH_RADIUS_KM
+
+
+class ComparablesIndex:
+    """k-nearest-neighbour search over location and home features together
+
+    Each listing is a point of its earth-centred coordinates in km and its
+    beds, baths and area scaled to km by feature_km, so one Euclidean
+    distance weighs "nearby" against "similar". A KD-tree over those points
+    is built in bulk in one call and answers a query in well under a
+    millisecond. Listings missing coordinates or a feature are left out.
+    """
+
+    def __init__(self, latitude, longitude, beds, baths, area, feature_km=None):
+        # Imported here to keep scipy off the startup path
+        from scipy.spatial import cKDTree
+
+        self.feature_km = dict(FEATURE_KM, **(feature_km or {}))
+        columns = [np.asarray(column, dtype=np.float64) for column in (latitude, longitude, beds, baths, area)]
+        valid = np.logical_and.reduce([np.isfinite(column) for column in columns])
+        self.rows = np.flatnonzero(valid)
+        self.latitude, self.longitude, beds, baths, area = (column[self.rows] for column in columns)
+        points = self._points(self.latitude, self.longitude, beds, baths, area)
+        self.tree = cKDTree(points, balanced_tree=False, compact_nodes=False)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _points(self, latitude, longitude, beds, baths, area):
+        features = np.column_stack([
+            np.asarray(beds, dtype=np.float64) * self.feature_km['beds'],
+            np.asarray(baths, dtype=np.float64) * self.feature_km['baths'],
+            np.asarray(area, dtype=np.float64) * self.feature_km['area'],
+        ])
+        return np.hstack([_earth_points(latitude, longitude), features])
+
+    def query(self, latitude, longitude, beds, baths, area, k=10, exclude=None):
+        """(rows, feature-space distances, km away) of the k listings most like the given home, closest first
+
+        `exclude` is a snapshot row left out of the results, e.g. the
+        listing the comparables are for.
+        """
+        k = min(k, len(self.rows) - (exclude is not None))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        point = self._points([latitude], [longitude], [beds], [baths], [area])[0]
+        feature_distances, positions = self.tree.query(point, k + (exclude is not None))
+        feature_distances, positions = np.atleast_1d(feature_distances), np.atleast_1d(positions)
+        if exclude is not None:
+            keep = self.rows[positions] != exclude
+            feature_distances, positions = feature_distances[keep][:k], positions[keep][:k]
+        distances = haversine_km(latitude, longitude, self.latitude[positions], self.longitude[positions])
+        return self.rows[positions], feature_distances, distances
+
+
+def summarize(prices, areas):
+    """Median price and price per sq ft over comparables, ignoring missing values"""
+    prices = np.asarray(prices, dtype=np.float64)
+    areas = np.asarray(areas, dtype=np.float64)
+    priced = np.isfinite(prices)
+    per_sqft = prices / areas
+    per_sqft = per_sqft[np.isfinite(per_sqft) & (areas > 0)]
+    return {
+        'medianPrice': float(np.median(prices[priced])) if priced.any() else None,
+        'medianPricePerSqft': float(np.median(per_sqft)) if len(per_sqft) else None
+    }
+
+
+def locality_center(snapshot, locality, region=None):
+    """Median coordinates of the snapshot's listings in a locality, or None when unknown"""
+    code = snapshot.dictionary('locality').code(locality)
+    if code < 0:
+        return None
+    rows = np.flatnonzero(np.asarray(snapshot.column('locality')) == code)
+    if region:
+        region_code = snapshot.dictionary('region').code(region)
+        in_region = rows[np.asarray(snapshot.column('region'))[rows] == region_code]
+        if len(in_region):
+            rows = in_region
+    latitude = np.asarray(snapshot.column('latitude'))[rows]
+    longitude = np.asarray(snapshot.column('longitude'))[rows]
+    located = np.isfinite(latitude) & np.isfinite(longitude)
+    if not located.any():
+        return None
+    center = float(np.median(latitude[located])), float(np.median(longitude[located]))
+    return center if all(math.isfinite(value) for value in center) else None
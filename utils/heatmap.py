@@ -0,0 +1,350 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import struct
+import sys
+import time
+
+import numpy as np
+
+from utils.clusters import mercator, tile_keys
+from utils.snapshot import ReopeningDirectory, Snapshot, replace_directory
+
+FORMAT_VERSION = 1
+
+# Each tile is a raster of 2**CELL_BITS x 2**CELL_BITS cells, 8 pixels wide
+# on a 256 pixel tile
+CELL_BITS = 5
+MAX_ZOOM = 10
+
+# Tile payload, little-endian: TILE_HEADER (magic, format version, cell bits,
+# number of cells n), then uint16 cell index (row * side + column) [n],
+# padding to 4 bytes, uint32 listing count [n], float32 median price per
+# sq ft [n] and float32 mean price per sq ft [n]. Every array starts 4-byte
+# aligned, so a browser can view it with typed arrays without copying.
+TILE_MAGIC = b'PPSF'
+TILE_HEADER = struct.Struct('<4sBBH')
+
+# Listing positions at the deepest zoom and their price per sq ft, kept per
+# source so a rebuild can tell which tiles a changed source touches
+POINT_DTYPE = np.dtype([('x', '<u4'), ('y', '<u4'), ('ppsf', '<f4')])
+
+
+def _file_name(source):
+    return re.sub(r'[^A-Za-z0-9_-]', '_', source) + '.points.npy'
+
+
+def source_points(snapshot, source, max_zoom=MAX_ZOOM, cell_bits=CELL_BITS):
+    """Deepest-level cells and price per sq ft of one source's priced listings"""
+    code = snapshot.dictionary('source').code(source)
+    rows = np.flatnonzero(np.asarray(snapshot.column('source')) == code)
+    latitude = snapshot.column('latitude')[rows]
+    longitude = snapshot.column('longitude')[rows]
+    price = snapshot.column('price')[rows]
+    area = snapshot.column('area')[rows]
+    keep = (np.isfinite(latitude) & np.isfinite(longitude) & (np.abs(latitude) <= 90)
+            & (np.abs(longitude) <= 180) & (price > 0) & (area > 0))
+    x, y = mercator(latitude[keep], longitude[keep])
+    scale = 1 << (max_zoom + cell_bits)
+    points = np.empty(int(keep.sum()), dtype=POINT_DTYPE)
+    points['x'] = np.minimum(x * scale, scale - 1)
+    points['y'] = np.minimum(y * scale, scale - 1)
+    points['ppsf'] = price[keep] / area[keep]
+    return points
+
+
+def point_tiles(points, zoom, max_zoom=MAX_ZOOM, cell_bits=CELL_BITS):
+    """Tile id, x << zoom | y, of every point at `zoom`"""
+    shift = max_zoom - zoom + cell_bits
+    x = points['x'].astype(np.int64) >> shift
+    y = points['y'].astype(np.int64) >> shift
+    return (x << zoom) | y
+
+
+def value_ranks(points):
+    """Rank of every point's price per sq ft, for sorting by cell and value in one pass"""
+    ranks = np.empty(len(points), dtype=np.int64)
+    ranks[np.argsort(points['ppsf'], kind='stable')] = np.arange(len(points))
+    return ranks
+
+
+def aggregate(points, ranks, zoom, max_zoom=MAX_ZOOM, cell_bits=CELL_BITS):
+    """(cell keys in tile order, counts, medians, means) of price per sq ft at `zoom`
+
+    ranks order the points by value (see value_ranks); ranks of a subset
+    of the points they were computed for work as well.
+    """
+    if not len(points):
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0), np.empty(0)
+    shift = max_zoom - zoom
+    key = tile_keys(zoom, points['x'].astype(np.int64) >> shift, points['y'].astype(np.int64) >> shift, cell_bits)
+    # One sort by (cell, value) puts every cell's values in order, which
+    # makes all the medians a gather
+    rank_bits = max(1, int(ranks.max()).bit_length())
+    if 2 * (zoom + cell_bits) + rank_bits <= 62:
+        order = np.argsort((key << rank_bits) | ranks)
+    else:
+        order = np.lexsort((ranks, key))
+    key, ppsf = key[order], points['ppsf'][order].astype(np.float64)
+    starts = np.flatnonzero(np.concatenate([[True], key[1:] != key[:-1]]))
+    counts = np.diff(np.append(starts, len(key)))
+    medians = (ppsf[starts + (counts - 1) // 2] + ppsf[starts + counts // 2]) / 2
+    means = np.add.reduceat(ppsf, starts) / counts
+    return key[starts], counts, medians, means
+
+
+def _scatter(data, positions, values, dtype):
+    """Write values as little-endian dtype at byte positions of data"""
+    values = np.ascontiguousarray(values, dtype=dtype)
+    width = values.dtype.itemsize
+    data[positions[:, None] + np.arange(width)] = values.view(np.uint8).reshape(-1, width)
+
+
+class TileLevel:
+    """The tiles of one zoom level: sorted tile ids and their payloads back to back"""
+
+    def __init__(self, tiles, offsets, data):
+        self.tiles = tiles
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.tiles)
+
+    @classmethod
+    def encode(cls, keys, counts, medians, means, cell_bits=CELL_BITS):
+        """Payloads of aggregated cells, laid out for every tile at once"""
+        mask = (1 << cell_bits) - 1
+        cell_tiles = keys >> (2 * cell_bits)
+        starts = np.flatnonzero(np.concatenate([[True], cell_tiles[1:] != cell_tiles[:-1]]))
+        sizes = np.diff(np.append(starts, len(keys)))
+        padded = 2 * sizes + 2 * (sizes % 2)
+        offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(TILE_HEADER.size + padded + 12 * sizes, out=offsets[1:])
+        data = np.zeros(int(offsets[-1]), dtype=np.uint8)
+
+        headers = np.zeros(len(starts), dtype=[('magic', 'S4'), ('version', 'u1'), ('bits', 'u1'), ('n', '<u2')])
+        headers['magic'] = TILE_MAGIC
+        headers['version'] = FORMAT_VERSION
+        headers['bits'] = cell_bits
+        headers['n'] = sizes
+        data[offsets[:-1, None] + np.arange(TILE_HEADER.size)] = headers.view(np.uint8).reshape(-1, TILE_HEADER.size)
+
+        tile = np.repeat(np.arange(len(starts)), sizes)
+        k = np.arange(len(keys)) - starts[tile]
+        n = sizes[tile]
+        base = offsets[:-1][tile] + TILE_HEADER.size
+        cells = ((keys & mask) << cell_bits) | ((keys >> cell_bits) & mask)
+        _scatter(data, base + 2 * k, cells, '<u2')
+        base = base + padded[tile]
+        _scatter(data, base + 4 * k, counts, '<u4')
+        _scatter(data, base + 4 * n + 4 * k, medians, '<f4')
+        _scatter(data, base + 8 * n + 4 * k, means, '<f4')
+        return cls(cell_tiles[starts], offsets, data)
+
+    @classmethod
+    def load(cls, path, zoom):
+        tiles = np.load(os.path.join(path, f'z{zoom}.tiles.npy'), mmap_mode='r')
+        offsets = np.load(os.path.join(path, f'z{zoom}.offsets.npy'))
+        data_path = os.path.join(path, f'z{zoom}.bin')
+        # An empty file cannot be memory-mapped
+        data = np.memmap(data_path, dtype=np.uint8, mode='r') if os.path.getsize(data_path) else np.empty(0, np.uint8)
+        return cls(tiles, offsets, data)
+
+    def payload(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def find(self, tile):
+        i = int(np.searchsorted(self.tiles, tile))
+        if i < len(self.tiles) and self.tiles[i] == tile:
+            return self.payload(i)
+        return None
+
+    def merge(self, other, replaced):
+        """This level with the tiles in `replaced` swapped for the tiles of other"""
+        keep = ~np.isin(self.tiles, replaced)
+        tiles = np.concatenate([self.tiles[keep], other.tiles])
+        order = np.argsort(tiles, kind='stable')
+        kept = np.flatnonzero(keep)
+        # (level, first tile index) of each merged tile; consecutive tiles of
+        # one level are copied as one run of bytes
+        level = np.concatenate([np.zeros(len(kept), np.int64), np.ones(len(other), np.int64)])[order]
+        index = np.concatenate([kept, np.arange(len(other))])[order]
+        breaks = np.flatnonzero((level[1:] != level[:-1]) | (index[1:] != index[:-1] + 1)) + 1
+        parts = []
+        for start, stop in zip(np.concatenate([[0], breaks]).tolist(), np.append(breaks, len(index)).tolist()):
+            source = self if level[start] == 0 else other
+            first, last = int(index[start]), int(index[stop - 1])
+            parts.append(source.data[source.offsets[first]:source.offsets[last + 1]])
+        lengths = np.concatenate([np.diff(self.offsets)[keep], np.diff(other.offsets)])[order]
+        offsets = np.zeros(len(tiles) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        data = np.concatenate(parts) if parts else np.empty(0, np.uint8)
+        return TileLevel(tiles[order], offsets, data)
+
+    def write(self, directory, zoom):
+        np.save(os.path.join(directory, f'z{zoom}.tiles.npy'), np.asarray(self.tiles, dtype=np.int64))
+        np.save(os.path.join(directory, f'z{zoom}.offsets.npy'), self.offsets)
+        with open(os.path.join(directory, f'z{zoom}.bin'), 'wb') as f:
+            f.write(np.asarray(self.data).tobytes())
+
+
+def decode_tile(payload):
+    """Arrays of a tile payload: cell column and row, count, median and mean"""
+    magic, version, cell_bits, n = TILE_HEADER.unpack_from(payload)
+    if magic != TILE_MAGIC or version != FORMAT_VERSION:
+        raise ValueError('not a heatmap tile')
+    offset = TILE_HEADER.size
+    cells = np.frombuffer(payload, '<u2', n, offset).astype(np.int64)
+    offset += 2 * n + (-2 * n % 4)
+    counts = np.frombuffer(payload, '<u4', n, offset)
+    medians = np.frombuffer(payload, '<f4', n, offset + 4 * n)
+    means = np.frombuffer(payload, '<f4', n, offset + 8 * n)
+    side = 1 << cell_bits
+    return {'column': cells % side, 'row': cells // side, 'count': counts, 'median': medians, 'mean': means}
+
+
+def _read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_heatmap(snapshot_path, out, max_zoom=MAX_ZOOM, full=False):
+    """Write price per sq ft tiles for zooms 0..max_zoom of a listing snapshot to `out`
+
+    When `out` holds tiles built with the same settings, only sources whose
+    scraper output changed since then are re-read from the snapshot, and
+    only the tiles their old or new listings fall in are recomputed; every
+    other tile is copied over as is. Returns the new meta with a
+    'changedSources' list.
+    """
+    snapshot = Snapshot(snapshot_path)
+    sources = snapshot.meta['sources']
+    previous = None if full else _read_meta(out)
+    if previous is not None and (
+            previous.get('formatVersion') != FORMAT_VERSION or previous.get('maxZoom') != max_zoom
+            or previous.get('cellBits') != CELL_BITS
+            or not all(os.path.exists(os.path.join(out, _file_name(source))) for source in previous['sources'])):
+        previous = None
+    # A listing scraped by two sources belongs to the one read last, which
+    # only moves between sources when one of them changes
+    old_sources = previous['sources'] if previous is not None else {}
+    changed = sorted(source for source in set(sources) | set(old_sources)
+                     if previous is None or sources.get(source) != old_sources.get(source))
+    if previous is not None and not changed:
+        return dict(previous, changedSources=[])
+
+    staging = out.rstrip('/') + '.building'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    points = {}
+    for source in sources:
+        if source in changed:
+            points[source] = source_points(snapshot, source, max_zoom)
+        else:
+            points[source] = np.load(os.path.join(out, _file_name(source)))
+        np.save(os.path.join(staging, _file_name(source)), points[source])
+    everything = np.concatenate(list(points.values())) if points else np.empty(0, dtype=POINT_DTYPE)
+    touched = None
+    if previous is not None:
+        touched = [points[source] for source in changed if source in points]
+        touched += [np.load(os.path.join(out, _file_name(source))) for source in changed if source in old_sources]
+        touched = np.concatenate(touched) if touched else np.empty(0, dtype=POINT_DTYPE)
+
+    ranks = value_ranks(everything)
+    tile_counts = []
+    for zoom in range(max_zoom + 1):
+        if touched is None:
+            level = TileLevel.encode(*aggregate(everything, ranks, zoom, max_zoom))
+        else:
+            affected = np.unique(point_tiles(touched, zoom, max_zoom))
+            inside = np.isin(point_tiles(everything, zoom, max_zoom), affected)
+            updated = TileLevel.encode(*aggregate(everything[inside], ranks[inside], zoom, max_zoom))
+            level = TileLevel.load(out, zoom).merge(updated, affected)
+        level.write(staging, zoom)
+        tile_counts.append(len(level))
+
+    meta = {
+        'formatVersion': FORMAT_VERSION,
+        'builtAt': time.time(),
+        'snapshotBuiltAt': snapshot.meta['builtAt'],
+        'maxZoom': max_zoom,
+        'cellBits': CELL_BITS,
+        'listings': len(everything),
+        'tilesPerZoom': tile_counts,
+        'sources': sources
+    }
+    with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    replace_directory(staging, out)
+    return dict(meta, changedSources=changed)
+
+
+class Heatmap:
+    """Read side of a heatmap directory"""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = _read_meta(path)
+        if self.meta is None or self.meta.get('formatVersion') != FORMAT_VERSION:
+            raise ValueError(f'no heatmap of format {FORMAT_VERSION} at {path}')
+        self.max_zoom = self.meta['maxZoom']
+        # Builds are named by their time, so a tile URL never changes content
+        self.build = format(int(self.meta['builtAt'] * 1000), 'x')
+        self.levels = [TileLevel.load(path, zoom) for zoom in range(self.max_zoom + 1)]
+
+    def tile(self, z, x, y):
+        """Payload of tile z/x/y, or None when no priced listing falls in it"""
+        return self.levels[z].find((x << z) | y)
+
+    def info(self):
+        return {
+            'build': self.build,
+            'builtAt': self.meta['builtAt'],
+            'snapshotBuiltAt': self.meta['snapshotBuiltAt'],
+            'minZoom': 0,
+            'maxZoom': self.max_zoom,
+            'cellsPerSide': 1 << self.meta['cellBits'],
+            'listings': self.meta['listings'],
+            'tilesPerZoom': self.meta['tilesPerZoom']
+        }
+
+
+class HeatmapStore(ReopeningDirectory):
+    """The heatmap at path, reopened when a rebuild replaces it"""
+
+    def __init__(self, path, check_interval=5.0):
+        super().__init__(path, Heatmap, check_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Price per sq ft heatmap tiles of the listing snapshot')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build or incrementally update the tiles')
+    build.add_argument('--snapshot', default='./utils/listings_snapshot')
+    build.add_argument('--out', default='./utils/listings_heatmap')
+    build.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    build.add_argument('--full', action='store_true', help='rebuild every tile even if sources are unchanged')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not os.path.exists(os.path.join(args.snapshot, 'meta.json')):
+            sys.exit(f'No listing snapshot at {args.snapshot}; run python -m utils.snapshot build first')
+        started = time.perf_counter()
+        meta = build_heatmap(args.snapshot, args.out, args.max_zoom, args.full)
+        if not meta['changedSources']:
+            print(f'Heatmap in {args.out} is up to date with {args.snapshot}')
+            return
+        changed = ', '.join(meta['changedSources'])
+        print(f"Heatmap of {meta['listings']} listings, {sum(meta['tilesPerZoom'])} tiles over zooms "
+              f"0-{meta['maxZoom']}, written to {args.out} in {time.perf_counter() - started:.2f}s "
+              f"(sources rebuilt: {changed})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+import json
+import time
+
+import numpy as np
+
+# Feature order every backend expects in its input matrix
+FEATURES = ['beds', 'baths', 'area']
+
+
+def get_booster(model):
+    """Return the native xgboost Booster behind a model object"""
+    if isinstance(model, dict):
+        raise ValueError('a bare model document has no xgboost Booster')
+    return model.get_booster() if hasattr(model, 'get_booster') else model
+
+
+def set_thread_count(model, nthread):
+    """Pin the OpenMP threads XGBoost uses per predict call"""
+    if isinstance(model, dict):
+        # Compiled from a model document: plain NumPy, nothing to configure
+        return
+    get_booster(model).set_param({'nthread': nthread})
+    if hasattr(model, 'n_jobs'):
+        model.n_jobs = nthread
+
+
+def read_model_document(path):
+    """Parse a native .json/.ubj model file without importing xgboost"""
+    if path.endswith('.ubj'):
+        from utils import ubjson
+        return ubjson.load(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class SklearnBackend:
+    """The original path: pandas DataFrame through XGBRegressor.predict"""
+
+    name = 'sklearn'
+
+    def __init__(self, model):
+        if not hasattr(model, 'get_booster'):
+            raise ValueError('sklearn backend needs an XGBRegressor')
+        import pandas as pd
+        self._pd = pd
+        self.model = model
+
+    def predict(self, matrix):
+        return self.model.predict(self._pd.DataFrame(matrix, columns=FEATURES))
+
+
+class BoosterBackend:
+    """Native Booster.inplace_predict on a NumPy array, no DataFrame or DMatrix"""
+
+    name = 'booster'
+
+    def __init__(self, model):
+        self.booster = get_booster(model)
+
+    def predict(self, matrix):
+        return self.booster.inplace_predict(matrix)
+
+
+class CompiledBackend:
+    """Trees flattened into NumPy arrays and evaluated without calling into XGBoost"""
+
+    name = 'compiled'
+
+    def __init__(self, model):
+        # Either a model object or an already parsed native model document
+        if isinstance(model, dict):
+            learner = model['learner']
+        else:
+            learner = json.loads(get_booster(model).save_raw(raw_format='json'))['learner']
+
+        objective = learner['objective']['name']
+        if objective not in ('reg:squarederror', 'reg:linear', 'reg:absoluteerror'):
+            raise ValueError(f'compiled backend does not support objective {objective}')
+        booster = learner['gradient_booster']
+        if booster['name'] != 'gbtree':
+            raise ValueError(f"compiled backend does not support {booster['name']} boosters")
+        if int(learner['learner_model_param'].get('num_target', '1')) != 1:
+            raise ValueError('compiled backend only supports single-target models')
+
+        # Newer releases store base_score as a one-element vector, e.g. "[6.8E5]"
+        self.base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+
+        trees = booster['model']['trees']
+        if any(any(tree.get('split_type', [])) for tree in trees):
+            raise ValueError('compiled backend does not support categorical splits')
+
+        n_nodes = max(int(tree['tree_param']['num_nodes']) for tree in trees)
+        shape = (len(trees), n_nodes)
+        self.feature = np.zeros(shape, dtype=np.intp)
+        self.threshold = np.zeros(shape, dtype=np.float32)
+        self.left = np.zeros(shape, dtype=np.intp)
+        self.right = np.zeros(shape, dtype=np.intp)
+        self.missing = np.zeros(shape, dtype=np.intp)
+        self.value = np.zeros(shape, dtype=np.float32)
+
+        depth = 0
+        splits = {}
+        for t, tree in enumerate(trees):
+            left = np.asarray(tree['left_children'], dtype=np.intp)
+            right = np.asarray(tree['right_children'], dtype=np.intp)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            default_left = np.asarray(tree['default_left'], dtype=bool)
+            nodes = np.arange(len(left))
+            leaf = left == -1
+
+            # Leaves point back at themselves so every row can take the same
+            # number of steps regardless of which branch it went down
+            self.feature[t, :len(left)] = np.where(leaf, 0, tree['split_indices'])
+            self.threshold[t, :len(left)] = conditions
+            self.left[t, :len(left)] = np.where(leaf, nodes, left)
+            self.right[t, :len(left)] = np.where(leaf, nodes, right)
+            self.missing[t, :len(left)] = np.where(default_left, self.left[t, :len(left)],
+                                                   self.right[t, :len(left)])
+            self.value[t, :len(left)] = np.where(leaf, conditions, 0)
+
+            split_features = np.asarray(tree['split_indices'], dtype=np.intp)[~leaf]
+            for f in np.unique(split_features).tolist():
+                splits.setdefault(f, []).append(conditions[~leaf][split_features == f])
+
+            depth = max(depth, self._depth(left, right))
+        self.depth = depth
+        # Every threshold each feature is compared against, for split_pattern()
+        self.split_thresholds = {f: np.unique(np.concatenate(values)) for f, values in splits.items()}
+
+        # Flatten to 1-D so traversal is a handful of take() calls on global node ids
+        offsets = np.arange(len(trees), dtype=np.intp) * n_nodes
+        self._roots = offsets
+        self.feature = self.feature.ravel()
+        self.threshold = self.threshold.ravel()
+        self.left = (self.left + offsets[:, None]).ravel()
+        self.right = (self.right + offsets[:, None]).ravel()
+        self.missing = (self.missing + offsets[:, None]).ravel()
+        self.value = self.value.ravel()
+
+    @staticmethod
+    def _depth(left, right):
+        depth, frontier = 0, [0]
+        while True:
+            frontier = [child for node in frontier if left[node] != -1
+                        for child in (left[node], right[node])]
+            if not frontier:
+                return depth
+            depth += 1
+
+    def split_pattern(self, column, values):
+        """Index of the threshold interval of each value; equal indexes take the same branches"""
+        thresholds = self.split_thresholds.get(column)
+        if thresholds is None:
+            return np.zeros(len(values), dtype=np.intp)
+        # Splits test x < threshold in float32, so compare in float32 too
+        return np.searchsorted(thresholds, np.asarray(values, dtype=np.float32), side='right')
+
+    def predict(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        n_features = matrix.shape[1]
+        flat = matrix.ravel()
+        row_base = (np.arange(len(matrix), dtype=np.intp) * n_features)[:, None]
+        node = np.broadcast_to(self._roots, (len(matrix), len(self._roots)))
+        for _ in range(self.depth):
+            x = flat.take(row_base + self.feature.take(node))
+            following = np.where(x < self.threshold.take(node),
+                                 self.left.take(node), self.right.take(node))
+            missing = np.isnan(x)
+            if missing.any():
+                following = np.where(missing, self.missing.take(node), following)
+            node = following
+        # Accumulate sequentially in float32 starting from the base score, the
+        # same order XGBoost uses, so results match it bit for bit
+        margin = np.empty((len(matrix), len(self._roots) + 1), dtype=np.float32)
+        margin[:, 0] = self.base_score
+        margin[:, 1:] = self.value.take(node)
+        return np.cumsum(margin, axis=1, dtype=np.float32)[:, -1]
+
+
+BACKENDS = {
+    backend.name: backend for backend in (SklearnBackend, BoosterBackend, CompiledBackend)
+}
+
+# Input sizes at which auto selection compares the backends to find where
+# the batch winner overtakes the single-row winner
+DISPATCH_PROBE_ROWS = (2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+class RowCountBackend:
+    """Two backends behind one: inputs under batch_rows rows go to `single`, larger ones to `batch`
+
+    The compiled backend wins on a single row but falls well behind
+    Booster.inplace_predict once an input has a few dozen rows, and the
+    serving backend also scores batches, streams, sweeps and micro-batches.
+    """
+
+    def __init__(self, single, batch, batch_rows):
+        self.name = f'{single.name}+{batch.name}'
+        self.single = single
+        self.batch = batch
+        self.batch_rows = batch_rows
+        # The split thresholds are the model's, whichever backend exposes them
+        for backend in (single, batch):
+            if hasattr(backend, 'split_pattern'):
+                self.split_pattern = backend.split_pattern
+                break
+
+    def predict(self, matrix):
+        return (self.single if len(matrix) < self.batch_rows else self.batch).predict(matrix)
+
+
+def predict_varying(backend, matrix, columns):
+    """Predict rows that only differ in `columns` (a sweep), scoring each distinct path once
+
+    Values that fall between the same pair of split thresholds go down the
+    same branches of every tree, so for backends that expose their splits
+    only one row per combination of threshold intervals is evaluated.
+    Results are identical to backend.predict(matrix).
+    """
+    if not hasattr(backend, 'split_pattern') or not len(matrix):
+        return backend.predict(matrix)
+    patterns = np.stack([backend.split_pattern(column, matrix[:, column]) for column in columns], axis=1)
+    _, first, inverse = np.unique(patterns, axis=0, return_index=True, return_inverse=True)
+    return np.asarray(backend.predict(matrix[first]))[inverse.reshape(-1)]
+
+
+def probe_matrix(n_rows=512, seed=0):
+    """Deterministic spread of plausible inputs used for parity checks and timing"""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(0, 12, n_rows),
+        rng.integers(0, 20, n_rows) / 2,
+        np.round(rng.uniform(100, 20000, n_rows), rng.integers(-1, 2))
+    ]).astype(np.float64)
+
+
+def check_parity(reference, candidate, matrix, rtol=1e-5, atol=1.0):
+    """True when candidate reproduces the reference backend on matrix"""
+    expected = np.asarray(reference.predict(matrix), dtype=np.float64)
+    actual = np.asarray(candidate.predict(matrix), dtype=np.float64)
+    return expected.shape == actual.shape and np.allclose(actual, expected, rtol=rtol, atol=atol)
+
+
+def time_single_row(backend, matrix, repeat=200):
+    """Median seconds per single-row prediction"""
+    rows = [matrix[i:i + 1] for i in range(min(repeat, len(matrix)))]
+    timings = []
+    for row in rows:
+        start = time.perf_counter()
+        backend.predict(row)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def time_rows(backend, matrix, n_rows, repeat=15):
+    """Median seconds per prediction of the first n_rows rows of matrix"""
+    rows = matrix[:n_rows]
+    backend.predict(rows)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        backend.predict(rows)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def dispatch_backend(single, batch, matrix):
+    """single, or a RowCountBackend handing inputs to batch from the size where batch is faster"""
+    for n_rows in DISPATCH_PROBE_ROWS:
+        if n_rows <= len(matrix) and time_rows(batch, matrix, n_rows) < time_rows(single, matrix, n_rows):
+            return RowCountBackend(single, batch, n_rows)
+    return single
+
+
+def select_backend(model, preference='auto', batch_rows=None):
+    """Build the requested backend, or benchmark all of them and keep the fastest matching one
+
+    Auto selection times every backend on single rows and on a batch of the
+    probe matrix. When different backends win the two, inputs are
+    dispatched by row count between them. A preference of "single+batch"
+    (e.g. "compiled+booster") names such a pair directly; only the row
+    count where they cross over is measured, unless batch_rows gives it.
+    """
+    if '+' in preference:
+        single, batch = (BACKENDS[name](model) for name in preference.split('+', 1))
+        if batch_rows is not None:
+            return RowCountBackend(single, batch, batch_rows), {}
+        return dispatch_backend(single, batch, probe_matrix()), {}
+    if preference != 'auto':
+        return BACKENDS[preference](model), {}
+
+    candidates = []
+    for cls in BACKENDS.values():
+        try:
+            candidates.append(cls(model))
+        except Exception as e:
+            print(f"Inference backend {cls.name} unavailable: {str(e)}")
+    if not candidates:
+        raise RuntimeError('no inference backend could be built for this model')
+
+    matrix = probe_matrix()
+    # The first available backend (sklearn when present) is the parity reference
+    reference = candidates[0]
+    report = {}
+    single, single_time = None, None
+    batch, batch_time = None, None
+    for backend in candidates:
+        matches = backend is reference or check_parity(reference, backend, matrix)
+        elapsed = time_single_row(backend, matrix)
+        batch_elapsed = time_rows(backend, matrix, len(matrix)) / len(matrix)
+        report[backend.name] = {
+            'parity': bool(matches),
+            'singleRowMicros': elapsed * 1e6,
+            'batchRowMicros': batch_elapsed * 1e6
+        }
+        if not matches:
+            continue
+        if single_time is None or elapsed < single_time:
+            single, single_time = backend, elapsed
+        if batch_time is None or batch_elapsed < batch_time:
+            batch, batch_time = backend, batch_elapsed
+    if single is None or single is batch:
+        return single, report
+    return dispatch_backend(single, batch, matrix), report
@@ -0,0 +1,100 @@
+import math
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of being queued for inference"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """Bounds how many model calls run at once and how long callers may wait
+
+    At most max_concurrency calls run; up to max_queue more callers wait for a
+    slot until their deadline. Anyone beyond that, or whose deadline passes
+    while waiting, gets Overloaded so the server can answer 429 right away
+    rather than let latency grow for everybody.
+    """
+
+    def __init__(self, max_concurrency, max_queue, default_deadline_ms):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.default_deadline = default_deadline_ms / 1000.0
+        self._slots = threading.Semaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.shed = {'queue_full': 0, 'deadline': 0}
+        # Moving average of call duration, used for Retry-After estimates
+        self._service_time = 0.001
+
+    def deadline(self, timeout_ms=None):
+        """Absolute perf_counter deadline for a request with an optional own budget"""
+        budget = self.default_deadline if timeout_ms is None else timeout_ms / 1000.0
+        return time.perf_counter() + budget
+
+    def retry_after(self):
+        """Whole seconds until the current backlog should have drained"""
+        backlog = (self.waiting + self.running + 1) * self._service_time / self.max_concurrency
+        return max(1, math.ceil(backlog))
+
+    def _shed(self, reason):
+        with self._lock:
+            self.shed[reason] += 1
+        raise Overloaded(reason, self.retry_after())
+
+    def run(self, fn, *args, deadline=None):
+        if deadline is None:
+            deadline = self.deadline()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queue:
+                    queue_full = True
+                else:
+                    queue_full = False
+                    self.waiting += 1
+            if queue_full:
+                self._shed('queue_full')
+            try:
+                acquired = self._slots.acquire(timeout=max(0.0, deadline - time.perf_counter()))
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                self._shed('deadline')
+
+        if time.perf_counter() >= deadline:
+            self._slots.release()
+            self._shed('deadline')
+
+        with self._lock:
+            self.running += 1
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self._service_time += 0.1 * (elapsed - self._service_time)
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'maxConcurrency': self.max_concurrency,
+                'maxQueue': self.max_queue,
+                'defaultDeadlineMs': self.default_deadline * 1000.0,
+                'running': self.running,
+                'waiting': self.waiting,
+                'completed': self.completed,
+                'shed': dict(self.shed),
+                'meanServiceMs': self._service_time * 1000.0
+            }
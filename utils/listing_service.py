@@ -0,0 +1,117 @@
+import base64
+import json
+import threading
+import time
+
+from utils.attribute_index import AttributeIndex
+from utils.clusters import ClusterPyramid
+from utils.comparables import ComparablesIndex
+from utils.snapshot import ReopeningDirectory, Snapshot
+from utils.spatial import GridIndex
+
+# Snapshot column names to the camelCase keys of the JSON API
+JSON_KEYS = {'home_url': 'homeUrl', 'image_link': 'imageLink'}
+
+
+def listing_json(row):
+    return {JSON_KEYS.get(name, name): value for name, value in row.items()}
+
+
+def encode_cursor(generation, *values):
+    """Opaque pagination cursor, tied to the snapshot it was issued for"""
+    text = json.dumps([generation, *values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, generation):
+    """Values encoded in a cursor; ValueError when malformed or from another snapshot"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('malformed cursor')
+    if not isinstance(values, list) or not values or not all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        raise ValueError('malformed cursor')
+    if values[0] != generation:
+        raise ValueError('cursor was issued for a previous listing snapshot; start over without it')
+    return values[1:]
+
+
+class ListingIndexes:
+    """A snapshot plus the query indexes built over it
+
+    Indexes never change once built; a new snapshot gets a new
+    ListingIndexes, so a query holding one keeps a consistent view.
+    ListingService builds them all before serving a snapshot; outside it
+    each is built on first use.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.generation = snapshot.meta['builtAt']
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self.build_seconds = {}
+
+    def _index(self, name, build):
+        index = self._indexes.get(name)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(name)
+                if index is None:
+                    started = time.perf_counter()
+                    index = build()
+                    self.build_seconds[name] = time.perf_counter() - started
+                    self._indexes[name] = index
+        return index
+
+    @property
+    def spatial(self):
+        return self._index('spatial', lambda: GridIndex(
+            self.snapshot.column('latitude'), self.snapshot.column('longitude')))
+
+    @property
+    def attributes(self):
+        return self._index('attributes', lambda: AttributeIndex(self.snapshot))
+
+    @property
+    def comparables(self):
+        return self._index('comparables', lambda: ComparablesIndex(
+            *(self.snapshot.column(name) for name in ('latitude', 'longitude', 'beds', 'baths', 'area'))))
+
+    @property
+    def clusters(self):
+        return self._index('clusters', lambda: ClusterPyramid(
+            self.snapshot.column('latitude'), self.snapshot.column('longitude'), self.snapshot.column('price')))
+
+    def build(self):
+        """Build every index now, so no query pays for one"""
+        for name in ('spatial', 'attributes', 'comparables', 'clusters'):
+            getattr(self, name)
+        return self
+
+    def listings(self, rows):
+        return [listing_json(row) for row in self.snapshot.rows_at(rows)]
+
+    def stats(self):
+        return {
+            'path': self.snapshot.path,
+            'rows': self.snapshot.rows,
+            'builtAt': self.snapshot.meta['builtAt'],
+            'sources': sorted(self.snapshot.meta['sources']),
+            'indexBuildSeconds': dict(self.build_seconds),
+            'clusters': self._indexes['clusters'].stats() if 'clusters' in self._indexes else None
+        }
+
+
+class ListingService(ReopeningDirectory):
+    """Serves the listing snapshot at path, picking up rebuilds of it
+
+    Every index is built when a snapshot is opened. A rebuilt snapshot is
+    opened and indexed in the background, and queries keep using the
+    previous one until it is ready.
+    """
+
+    def __init__(self, path, check_interval=5.0):
+        super().__init__(path, lambda path: ListingIndexes(Snapshot(path)).build(), check_interval)
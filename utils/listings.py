@@ -0,0 +1,142 @@
+import json
+import re
+
+# Scraper outputs under script/, keyed by the source name the web app uses
+SOURCE_FILES = {
+    'Redfin': './script/redfin_home_data.json',
+    'RealEstate': './script/realestate_home_data.json',
+    'JamesEdition': './script/jamesedition_home_data.json',
+}
+
+NUMBER_PATTERN = re.compile(r'-?\d[\d,]*(?:\.\d+)?')
+
+# The realestate scraper wraps its listings in {"listings": [...], "metadata": {...}}
+WRAPPED_LISTINGS = re.compile(r'\{\s*"listings"\s*:\s*\[')
+
+
+def parse_number(value):
+    """First number in a scraped field ("$1,210,000", "3 beds", "1,234 sq ft"), or None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_PATTERN.search(str(value))
+    if not match:
+        return None
+    return float(match.group(0).replace(',', ''))
+
+
+def normalize_listing(listing):
+    """(beds, baths, area in sq ft, price in USD) of a listing from any scraper"""
+    area = listing.get('area')
+    if area is None:
+        area = listing.get('area_sqft')
+    price = listing.get('price_usd')
+    if price is None:
+        price = listing.get('price')
+    if price is None:
+        price = listing.get('price_value')
+    return (
+        parse_number(listing.get('beds')),
+        parse_number(listing.get('baths')),
+        parse_number(area),
+        parse_number(price)
+    )
+
+
+class _StreamReader:
+    """Incremental JSON value reader over a text stream"""
+
+    def __init__(self, stream, chunk_size=1 << 16):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has been consumed so memory stays bounded by one chunk
+        # plus the value being read
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or '' at the end of the stream"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'expected {char!r} at offset {self.pos}')
+        self.pos += 1
+
+    def starts_with(self, pattern):
+        # Enough of the stream to recognise a short prefix
+        while len(self.buffer) - self.pos < 256 and not self.eof:
+            self._fill()
+        return pattern.match(self.buffer, self.pos) is not None
+
+    def skip_to(self, pattern):
+        match = pattern.match(self.buffer, self.pos)
+        self.pos = match.end()
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number cut off at the end of the buffer would still parse,
+                # so only trust values followed by more input
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                return value
+
+
+def iter_listings(stream, chunk_size=1 << 16):
+    """Yield listings one at a time from NDJSON, a JSON array or the realestate wrapper
+
+    Only one read chunk and one listing are held in memory at a time, so
+    arbitrarily large scraper outputs can be processed.
+    """
+    reader = _StreamReader(stream, chunk_size)
+    first = reader.peek()
+    if first == '':
+        return
+
+    if first == '[' or reader.starts_with(WRAPPED_LISTINGS):
+        if first == '[':
+            reader.expect('[')
+        else:
+            reader.skip_to(WRAPPED_LISTINGS)
+        if reader.peek() == ']':
+            return
+        while True:
+            yield reader.value()
+            separator = reader.peek()
+            reader.pos += 1
+            if separator == ']':
+                # Anything after the array (the realestate metadata) is ignored
+                return
+            if separator != ',':
+                raise ValueError(f'expected "," or "]" in listing array, got {separator!r}')
+
+    # NDJSON: one listing object after another
+    while reader.peek() != '':
+        yield reader.value()
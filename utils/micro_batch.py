@@ -0,0 +1,181 @@
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+
+from utils.inference_executor import Overloaded
+
+# Upper bounds of the batch size and queueing delay (ms) histogram buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+QUEUE_DELAY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100]
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-row predictions into one matrix call
+
+    Callers submit a feature row and wait on the returned Future. A background
+    thread takes the first pending row, keeps collecting until the window
+    since that row arrived has elapsed or max_batch rows are queued, scores
+    them together and resolves every caller's Future with its own value.
+
+    At most max_queue rows wait; submitting beyond that raises Overloaded.
+    Rows whose caller gave up (a cancelled Future) or whose deadline has
+    passed by the time their batch is collected are dropped unscored.
+    """
+
+    def __init__(self, predict_fn, window_ms=2.0, max_batch=256, max_queue=1024):
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+        self.shed = {'queue_full': 0, 'deadline': 0}
+        # Moving average of one batch's scoring time, used for Retry-After
+        self._batch_time = 0.001
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.queue_delay_counts = [0] * (len(QUEUE_DELAY_BUCKETS_MS) + 1)
+        self.queue_delay_sum_ms = 0.0
+        self.queue_delay_max_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def retry_after(self):
+        """Whole seconds until the rows queued now should have been scored"""
+        batches = self._queue.qsize() / self.max_batch + 1
+        return max(1, math.ceil(batches * (self.window + self._batch_time)))
+
+    def _shed(self, reason):
+        with self._lock:
+            self.shed[reason] += 1
+        return Overloaded(reason, self.retry_after())
+
+    def submit(self, row, predict_fn=None, deadline=None):
+        """Queue one row; predict_fn overrides the default scorer for this row
+
+        deadline is a perf_counter time after which the row is no longer
+        worth scoring. Raises Overloaded when the queue is full.
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((row, future, time.perf_counter(), predict_fn or self.predict_fn, deadline))
+        except queue.Full:
+            raise self._shed('queue_full')
+        return future
+
+    def predict(self, row, predict_fn=None, deadline=None):
+        """Score one row, raising Overloaded if it is not done by the deadline"""
+        future = self.submit(row, predict_fn, deadline)
+        timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            # Still queued: cancelling keeps the batcher from scoring it
+            future.cancel()
+            raise self._shed('deadline')
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Window is over, but take whatever is already waiting
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _live(self, batch, now):
+        """Items of batch still worth scoring; the rest are resolved or dropped"""
+        live = []
+        for item in batch:
+            future, deadline = item[1], item[4]
+            if not future.set_running_or_notify_cancel():
+                continue
+            if deadline is not None and now >= deadline:
+                future.set_exception(self._shed('deadline'))
+                continue
+            live.append(item)
+        return live
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            live = self._live(batch, started)
+            # Rows queued around a model swap may name different scorers
+            groups = {}
+            for item in live:
+                groups.setdefault(item[3], []).append(item)
+            for predict_fn, items in groups.items():
+                self._score(predict_fn, items)
+            if live:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self._batch_time += 0.1 * (elapsed - self._batch_time)
+                self._record(live, started)
+
+    def _score(self, predict_fn, items):
+        matrix = np.array([item[0] for item in items], dtype=np.float64)
+        try:
+            predictions = np.asarray(predict_fn(matrix)).tolist()
+        except Exception as e:
+            for item in items:
+                item[1].set_exception(e)
+            with self._lock:
+                self.errors += 1
+        else:
+            for item, prediction in zip(items, predictions):
+                item[1].set_result(prediction)
+
+    def _record(self, batch, started):
+        delays = [(started - item[2]) * 1000.0 for item in batch]
+        with self._lock:
+            self.batches += 1
+            self.rows += len(batch)
+            self.batch_size_counts[_bucket(BATCH_SIZE_BUCKETS, len(batch))] += 1
+            for delay in delays:
+                self.queue_delay_counts[_bucket(QUEUE_DELAY_BUCKETS_MS, delay)] += 1
+            self.queue_delay_sum_ms += sum(delays)
+            self.queue_delay_max_ms = max(self.queue_delay_max_ms, max(delays))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'windowMs': self.window * 1000.0,
+                'maxBatch': self.max_batch,
+                'maxQueue': self.max_queue,
+                'queued': self._queue.qsize(),
+                'shed': dict(self.shed),
+                'batches': self.batches,
+                'rows': self.rows,
+                'errors': self.errors,
+                'meanBatchSize': self.rows / self.batches if self.batches else 0.0,
+                'batchSizeHistogram': _histogram(BATCH_SIZE_BUCKETS, self.batch_size_counts),
+                'meanQueueDelayMs': self.queue_delay_sum_ms / self.rows if self.rows else 0.0,
+                'maxQueueDelayMs': self.queue_delay_max_ms,
+                'queueDelayHistogramMs': _histogram(QUEUE_DELAY_BUCKETS_MS, self.queue_delay_counts)
+            }
+
+
+def _bucket(bounds, value):
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            return i
+    return len(bounds)
+
+
+def _histogram(bounds, counts):
+    labels = [str(bound) for bound in bounds] + ['+Inf']
+    return dict(zip(labels, counts))
@@ -0,0 +1,288 @@
+import json
+import os
+import re
+import threading
+import time
+
+from utils.inference import probe_matrix, read_model_document, select_backend, set_thread_count
+from utils.artifacts import file_version, stamped_version, write_version_stamp
+
+# Versioned artifacts are written by utils/Model.py as <name>-<version>.<ext>
+ARTIFACT_PATTERN = re.compile(r'^(?P<name>.+)-(?P<version>[0-9A-Za-z]+)\.(?P<ext>pkl|ubj|json)$')
+
+# XGBoost's native formats load without unpickling the sklearn wrapper, so
+# they win over a pickle of the same version
+FORMAT_PREFERENCE = {'pkl': 0, 'json': 1, 'ubj': 2}
+NATIVE_FORMATS = ('.ubj', '.json')
+
+# A version pinned through /admin/reload, shared by every process serving
+# the directory
+PIN_FILENAME = 'pinned_version.json'
+
+
+def artifact_version(path):
+    """Version embedded in a versioned artifact's name, else its version stamp, else a content hash"""
+    match = ARTIFACT_PATTERN.match(os.path.basename(path))
+    if match:
+        return match.group('version')
+    return stamped_version(path) or file_version(path)
+
+
+def list_artifacts(model_dir):
+    """Versioned artifacts in model_dir, oldest first (versions sort by time)"""
+    if not model_dir or not os.path.isdir(model_dir):
+        return []
+    names = [name for name in os.listdir(model_dir) if ARTIFACT_PATTERN.match(name)]
+
+    def sort_key(name):
+        match = ARTIFACT_PATTERN.match(name)
+        return match.group('version'), FORMAT_PREFERENCE[match.group('ext')]
+
+    names.sort(key=sort_key)
+    return [os.path.join(model_dir, name) for name in names]
+
+
+def load_model(path):
+    """Load a native XGBoost model file as a Booster, anything else through joblib"""
+    if path.endswith(NATIVE_FORMATS):
+        # Skips pickle, sklearn and pandas entirely
+        import xgboost
+        return xgboost.Booster(model_file=path)
+    import joblib
+    return joblib.load(path)
+
+
+def export_native(path, out=None):
+    """Save a pickled model in XGBoost's native UBJSON format, stamped with the pickle's version"""
+    version = artifact_version(path)
+    model = load_model(path)
+    out = out or os.path.splitext(path)[0] + '.ubj'
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    booster.save_model(out)
+    if not ARTIFACT_PATTERN.match(os.path.basename(out)):
+        write_version_stamp(version, [path, out])
+    return out
+
+
+class ModelHandle:
+    """Everything needed to serve one model version; never mutated after load"""
+
+    def __init__(self, version, path, model, backend, backend_report, load_seconds):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.backend = backend
+        self.backend_report = backend_report
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    def info(self):
+        return {
+            'version': self.version,
+            'path': self.path,
+            'backend': self.backend.name,
+            'loadSeconds': self.load_seconds,
+            'loadedAt': self.loaded_at
+        }
+
+
+class ModelRegistry:
+    """Holds the serving model and swaps in new versions without blocking requests
+
+    Request handlers read `registry.current` once and use that handle until
+    they respond, so a swap never affects a request already in flight.
+    """
+
+    def __init__(self, model_dir, fallback_path, backend_preference='auto', nthread=None):
+        self.model_dir = model_dir
+        self.nthread = nthread
+        # A native export next to the legacy pickle is preferred when present
+        native = os.path.splitext(fallback_path)[0] + '.ubj'
+        self.fallback_path = native if os.path.exists(native) else fallback_path
+        self.backend_preference = backend_preference
+        self.current = None
+        self.last_error = None
+        self._listeners = []
+        self._pollers = []
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        # Signature of the artifact last loaded, compared by the watcher
+        self._seen = None
+
+    def on_swap(self, listener):
+        """Call listener(handle) every time a new model starts serving"""
+        self._listeners.append(listener)
+
+    def on_poll(self, poller):
+        """Call poller() from the watcher thread on every check of the model directory"""
+        self._pollers.append(poller)
+
+    def pinned_version(self):
+        """Version pinned in the model directory, None when serving the newest"""
+        if not self.model_dir:
+            return None
+        try:
+            with open(os.path.join(self.model_dir, PIN_FILENAME), 'r', encoding='utf-8') as f:
+                return json.load(f)['version']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def pin(self, version=None):
+        """Make every process serving the directory serve version, or the newest when None
+
+        The pin is a file in the model directory, so the watchers of all
+        workers, and workers forked later, resolve to the same artifact.
+        """
+        if not self.model_dir:
+            if version is not None:
+                raise ValueError('pinning a version needs a model directory')
+            return
+        pin_path = os.path.join(self.model_dir, PIN_FILENAME)
+        if version is None:
+            try:
+                os.remove(pin_path)
+            except FileNotFoundError:
+                pass
+            return
+        self.resolve(version)
+        with open(pin_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'pinnedAt': time.time()}, f)
+        os.replace(pin_path + '.tmp', pin_path)
+
+    def resolve(self, version=None):
+        """Path of the requested version, else of the pinned one, else of the newest artifact available"""
+        artifacts = list_artifacts(self.model_dir)
+        version = version if version is not None else self.pinned_version()
+        if version is not None:
+            matches = [path for path in artifacts if artifact_version(path) == version]
+            if not matches:
+                raise ValueError(f'unknown model version {version}')
+            return matches[-1]
+        if artifacts:
+            return artifacts[-1]
+        return self.fallback_path
+
+    def load(self, path, backend_preference=None, batch_rows=None):
+        """Load, pick a backend for and warm up the model at path
+
+        batch_rows is the crossover of a "single+batch" preference when it
+        is already known, which skips timing the two backends again.
+        """
+        start = time.perf_counter()
+        backend_preference = backend_preference or self.backend_preference
+        if backend_preference == 'compiled' and path.endswith(NATIVE_FORMATS):
+            # The compiled backend only needs the trees, so xgboost (and the
+            # sklearn stack it imports) is never loaded
+            model = read_model_document(path)
+        else:
+            model = load_model(path)
+        if self.nthread:
+            set_thread_count(model, self.nthread)
+        backend, report = select_backend(model, backend_preference, batch_rows)
+        # Pay one-time allocation and thread setup costs before the model takes
+        # traffic, for both the batch and the single-row shapes
+        warmup = probe_matrix(64)
+        backend.predict(warmup)
+        for i in range(16):
+            backend.predict(warmup[i:i + 1])
+        return ModelHandle(artifact_version(path), path, model, backend, report,
+                           time.perf_counter() - start)
+
+    def reload(self, version=None):
+        """Load a version in the calling thread and swap it in atomically"""
+        with self._reload_lock:
+            try:
+                path = self.resolve(version)
+                handle = self.load(path)
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self.last_error = None
+            self._seen = self._signature(path)
+            # A single attribute assignment: readers see the old or the new
+            # handle, never a half-initialised one
+            self.current = handle
+            for listener in self._listeners:
+                listener(handle)
+            print(f"Serving model version {handle.version} ({handle.backend.name} backend, "
+                  f"loaded in {handle.load_seconds:.2f}s)")
+            return handle
+
+    def reload_in_background(self, version=None):
+        def run():
+            try:
+                self.reload(version)
+            except Exception as e:
+                print(f"Model reload failed: {str(e)}")
+        thread = threading.Thread(target=run, name='model-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def _signature(self, path=None):
+        path = path or self.resolve()
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except OSError:
+            return path, None
+
+    def start_watcher(self, interval):
+        """Poll the model directory and reload when a newer artifact appears or the pin changes"""
+        if interval <= 0:
+            return
+
+        def watch():
+            # Start from the artifact this process serves, not the newest one:
+            # a worker forked from a long-running master inherits its startup
+            # model and has to catch up on the first check
+            current = self.current
+            self._seen = self._signature(current.path) if current is not None else None
+            while True:
+                try:
+                    signature = self._signature()
+                except Exception as e:
+                    print(f"Model watcher error: {str(e)}")
+                    signature = self._seen
+                if self._seen is None:
+                    # Nothing served yet; the startup load picks the newest
+                    self._seen = signature
+                elif signature != self._seen:
+                    self._seen = signature
+                    try:
+                        self.reload()
+                    except Exception as e:
+                        print(f"Model reload failed: {str(e)}")
+                for poller in self._pollers:
+                    try:
+                        poller()
+                    except Exception as e:
+                        print(f"Model watcher error: {str(e)}")
+                time.sleep(interval)
+
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def status(self):
+        return {
+            'current': self.current.info() if self.current is not None else None,
+            'available': sorted({artifact_version(path) for path in list_artifacts(self.model_dir)}),
+            'pinned': self.pinned_version(),
+            'lastError': self.last_error
+        }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Model artifact tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='convert a pickled model to native UBJSON')
+    export.add_argument('model')
+    export.add_argument('--out')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        print(f"Model exported to {export_native(args.model, args.out)}")
+
+
+if __name__ == '__main__':
+    main()
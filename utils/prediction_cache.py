@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+
+
+def normalize_key(beds, baths, area):
+    """Map equivalent inputs ("3", 3, 3.0) onto the same cache key"""
+    return (round(float(beds), 4), round(float(baths), 4), round(float(area), 4))
+
+
+class PredictionCache:
+    """Thread-safe bounded LRU of predicted prices keyed by model version and inputs"""
+
+    def __init__(self, max_size=10000, model_version=None):
+        self.max_size = max_size
+        self.model_version = model_version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def set_model_version(self, model_version):
+        # Entries scored by an older model are never valid again
+        with self._lock:
+            if model_version != self.model_version:
+                if self.model_version is not None:
+                    self.invalidations += 1
+                self.model_version = model_version
+                self._entries.clear()
+
+    def get(self, model_version, key):
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            value = self._entries.get((model_version, key))
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((model_version, key))
+            self.hits += 1
+            return value
+
+    def put(self, model_version, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if model_version != self.model_version:
+                # Result of a model that has since been swapped out
+                return
+            self._entries[(model_version, key)] = value
+            self._entries.move_to_end((model_version, key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'modelVersion': self.model_version,
+                'size': len(self._entries),
+                'maxSize': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hitRate': self.hits / lookups if lookups else 0.0
+            }
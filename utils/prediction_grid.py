@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+# Axis order matches the model's feature order
+AXES = ['beds', 'baths', 'area']
+
+DEFAULT_SPEC = {
+    'beds': (0, 15, 1),
+    'baths': (0, 15, 0.5),
+    'area': (0, 20000, 10),
+}
+
+
+def axis_values(start, stop, step):
+    """Inclusive list of grid points for one axis"""
+    count = int(round((stop - start) / step)) + 1
+    return start + step * np.arange(count, dtype=np.float64)
+
+
+def metadata_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+def build_grid(predict_fn, path, spec=DEFAULT_SPEC, model_version=None):
+    """Evaluate predict_fn over every grid point and store the result as a .npy file"""
+    values = [axis_values(*spec[axis]) for axis in AXES]
+    shape = tuple(len(v) for v in values)
+
+    grid = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+
+    # One beds slice at a time keeps the feature matrix small
+    baths, area = np.meshgrid(values[1], values[2], indexing='ij')
+    for i, beds in enumerate(values[0]):
+        matrix = np.column_stack([
+            np.full(baths.size, beds),
+            baths.ravel(),
+            area.ravel()
+        ])
+        grid[i] = np.asarray(predict_fn(matrix), dtype=np.float32).reshape(shape[1:])
+    grid.flush()
+    del grid
+
+    with open(metadata_path(path), 'w', encoding='utf-8') as f:
+        json.dump({
+            'modelVersion': model_version,
+            'axes': {axis: list(spec[axis]) for axis in AXES},
+            'shape': list(shape)
+        }, f, indent=2)
+
+    return shape
+
+
+class PredictionGrid:
+    """Memory-mapped table of precomputed predictions answered by index lookup"""
+
+    def __init__(self, path):
+        with open(metadata_path(path), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.model_version = meta['modelVersion']
+        self.grid = np.load(path, mmap_mode='r')
+        self._axes = []
+        for axis, size in zip(AXES, self.grid.shape):
+            start, stop, step = meta['axes'][axis]
+            self._axes.append((float(start), float(step), size))
+        self.hits = 0
+        self.misses = 0
+
+    def _index(self, value, axis):
+        start, step, size = self._axes[axis]
+        position = (value - start) / step
+        index = int(round(position))
+        # Only exact grid points are answered, everything else goes to the model
+        if 0 <= index < size and abs(position - index) < 1e-9:
+            return index
+        return None
+
+    def lookup(self, beds, baths, area):
+        i = self._index(beds, 0)
+        j = self._index(baths, 1) if i is not None else None
+        k = self._index(area, 2) if j is not None else None
+        if k is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return float(self.grid[i, j, k])
+
+    def stats(self):
+        return {
+            'modelVersion': self.model_version,
+            'shape': list(self.grid.shape),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def main():
+    from utils.inference import BoosterBackend
+    from utils.model_registry import artifact_version, load_model
+
+    parser = argparse.ArgumentParser(description='Precompute model predictions over a feature grid')
+    parser.add_argument('--model', default='./utils/house_price_prediction_model.pkl')
+    parser.add_argument('--out', default='./utils/prediction_grid.npy')
+    for axis in AXES:
+        parser.add_argument(f'--{axis}', nargs=3, type=float, metavar=('START', 'STOP', 'STEP'),
+                            default=DEFAULT_SPEC[axis])
+    args = parser.parse_args()
+
+    backend = BoosterBackend(load_model(args.model))
+    spec = {axis: tuple(getattr(args, axis)) for axis in AXES}
+
+    shape = build_grid(backend.predict, args.out, spec, artifact_version(args.model))
+    print(f"Prediction grid {shape} saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+def _frame_name(code):
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+def _stack(frame):
+    """Root-first frame names of a Python stack"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def folded(counts):
+    """Collapsed-stack text ("root;child;leaf weight" per line) for flamegraph.pl or speedscope"""
+    lines = [f'{stack} {int(weight)}' for stack, weight in counts.most_common() if weight >= 1]
+    return '\n'.join(lines) + '\n'
+
+
+def sample(seconds, interval=0.005):
+    """Sample every thread's stack for `seconds`; weights are sample counts"""
+    counts = Counter()
+    me = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            thread = names.get(ident, str(ident))
+            counts[';'.join([f'thread:{thread}'] + _stack(frame))] += 1
+        time.sleep(interval)
+    return counts
+
+
+class _Tracer:
+    """sys.setprofile hook attributing self time (in microseconds) to full call stacks"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.stack = []
+        self.last = time.perf_counter()
+
+    def _charge(self, now):
+        if self.stack:
+            self.counts[';'.join(self.stack)] += (now - self.last) * 1e6
+        self.last = now
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call':
+            self._charge(now)
+            self.stack.append(_frame_name(frame.f_code))
+        elif event == 'c_call':
+            self._charge(now)
+            self.stack.append(f'<builtin>:{getattr(arg, "__qualname__", repr(arg))}')
+        elif event in ('return', 'c_return', 'c_exception'):
+            self._charge(now)
+            if self.stack:
+                self.stack.pop()
+
+
+def trace(fn, *args, **kwargs):
+    """Run fn under a deterministic profiler, returning (result, stack weights)"""
+    tracer = _Tracer()
+    sys.setprofile(tracer)
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        sys.setprofile(None)
+    tracer._charge(time.perf_counter())
+    return result, tracer.counts
+
+
+class ProfileStore:
+    """The most recent profiles, retrievable by id
+
+    Holds per-request traces and the results of background samples. At most
+    one sample runs at a time per process.
+    """
+
+    def __init__(self, max_profiles=20):
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._sampling = None
+
+    def _new_id(self):
+        self._next_id += 1
+        return f'{os.getpid()}-{self._next_id}'
+
+    def _put(self, profile_id, counts):
+        self._profiles[profile_id] = counts
+        while len(self._profiles) > self.max_profiles:
+            self._profiles.popitem(last=False)
+
+    def add(self, counts):
+        with self._lock:
+            profile_id = self._new_id()
+            self._put(profile_id, counts)
+        return profile_id
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def sampling(self):
+        """Id of the sample still being taken, or None"""
+        with self._lock:
+            return self._sampling
+
+    def start_sample(self, seconds, interval=0.005):
+        """Sample every thread from a background thread, returning the id its result will have
+
+        The caller's thread is free meanwhile, so a single-threaded worker
+        keeps serving requests and they show up in the sample. Returns None
+        while another sample is running.
+        """
+        with self._lock:
+            if self._sampling is not None:
+                return None
+            profile_id = self._sampling = self._new_id()
+
+        def run():
+            counts = sample(seconds, interval)
+            with self._lock:
+                self._put(profile_id, counts)
+                self._sampling = None
+
+        threading.Thread(target=run, name='profile-sampler', daemon=True).start()
+        return profile_id
@@ -0,0 +1,179 @@
+import math
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+# Relative differences from the serving model counted as agreement
+AGREEMENT_TOLERANCES = [0.01, 0.05, 0.1]
+
+
+class ComparisonStats:
+    """Streaming statistics of a candidate's predictions against the serving model's
+
+    Mean and variance use Welford's update, so they stay numerically stable
+    over any number of rows in constant memory.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._mean_diff = 0.0
+        self._m2_diff = 0.0
+        self.abs_diff_total = 0.0
+        self.rel_diff_total = 0.0
+        self.max_abs_diff = 0.0
+        self.serving_total = 0.0
+        self.candidate_total = 0.0
+        self.within = [0] * len(AGREEMENT_TOLERANCES)
+
+    def update(self, serving, candidate):
+        diff = candidate - serving
+        for d in diff.tolist():
+            self.count += 1
+            delta = d - self._mean_diff
+            self._mean_diff += delta / self.count
+            self._m2_diff += delta * (d - self._mean_diff)
+        abs_diff = np.abs(diff)
+        rel_diff = abs_diff / np.maximum(np.abs(serving), 1.0)
+        self.abs_diff_total += float(abs_diff.sum())
+        self.rel_diff_total += float(rel_diff.sum())
+        self.max_abs_diff = max(self.max_abs_diff, float(abs_diff.max()))
+        self.serving_total += float(serving.sum())
+        self.candidate_total += float(candidate.sum())
+        for i, tolerance in enumerate(AGREEMENT_TOLERANCES):
+            self.within[i] += int((rel_diff <= tolerance).sum())
+
+    def summary(self):
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'meanDiff': self._mean_diff,
+            'stdDiff': math.sqrt(self._m2_diff / (self.count - 1)) if self.count > 1 else 0.0,
+            'meanAbsDiff': self.abs_diff_total / self.count,
+            'meanRelativeDiff': self.rel_diff_total / self.count,
+            'maxAbsDiff': self.max_abs_diff,
+            'servingMean': self.serving_total / self.count,
+            'candidateMean': self.candidate_total / self.count,
+            'agreement': {str(tolerance): within / self.count
+                          for tolerance, within in zip(AGREEMENT_TOLERANCES, self.within)}
+        }
+
+
+class _Candidate:
+    def __init__(self, name, handle):
+        self.name = name
+        self.handle = handle
+        self.stats = ComparisonStats()
+        self.errors = 0
+        self.predict_seconds = 0.0
+
+
+class ShadowScorer:
+    """Scores a sample of live inputs with candidate models on a background thread
+
+    offer() is all the request path pays: a random draw and a non-blocking
+    put. When the bounded queue is full the row is dropped and counted, so
+    a slow candidate can never hold up the primary response.
+    """
+
+    def __init__(self, sample_rate=0.1, max_queue=10000, batch_size=256, batch_wait_ms=50.0):
+        self.sample_rate = sample_rate
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._candidates = {}
+        self._thread = None
+        self.serving_version = None
+        # Request-path counters are bumped without the lock to keep offer()
+        # cheap; they are statistics, not accounting
+        self.offered = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def add_candidate(self, name, handle):
+        with self._lock:
+            self._candidates[name] = _Candidate(name, handle)
+
+    def reset(self, serving_version=None):
+        """Start the comparisons over, e.g. once a different model is serving"""
+        with self._lock:
+            self.serving_version = serving_version
+            for name, candidate in list(self._candidates.items()):
+                self._candidates[name] = _Candidate(name, candidate.handle)
+
+    def offer(self, row, serving_prediction):
+        self.offered += 1
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((row, serving_prediction))
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='shadow-scorer', daemon=True)
+        self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            matrix = np.array([row for row, _ in batch], dtype=np.float64)
+            serving = np.array([prediction for _, prediction in batch], dtype=np.float64)
+            with self._lock:
+                candidates = list(self._candidates.values())
+            for candidate in candidates:
+                started = time.perf_counter()
+                try:
+                    predictions = np.asarray(candidate.handle.backend.predict(matrix), dtype=np.float64)
+                except Exception as e:
+                    candidate.errors += 1
+                    print(f"Shadow scoring with {candidate.name} failed: {str(e)}")
+                    continue
+                candidate.predict_seconds += time.perf_counter() - started
+                with self._lock:
+                    candidate.stats.update(serving, predictions)
+            self.batches += 1
+
+    def stats(self):
+        with self._lock:
+            candidates = {
+                name: {
+                    'version': candidate.handle.version,
+                    'path': candidate.handle.path,
+                    'backend': candidate.handle.backend.name,
+                    'errors': candidate.errors,
+                    'predictMicrosPerRow': candidate.predict_seconds / candidate.stats.count * 1e6
+                    if candidate.stats.count else None,
+                    'comparison': candidate.stats.summary()
+                }
+                for name, candidate in self._candidates.items()
+            }
+        return {
+            'sampleRate': self.sample_rate,
+            'servingVersion': self.serving_version,
+            'queued': self._queue.qsize(),
+            'maxQueue': self.max_queue,
+            'offered': self.offered,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'candidates': candidates
+        }
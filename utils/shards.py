@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from utils.model_registry import list_artifacts
+
+# Request fields that name a region, most specific first. A city such as
+# "San Diego, CA" (the format of script/state_data.json) routes by its suffix
+REGION_FIELDS = ('region', 'state', 'city', 'country')
+
+
+def region_key(value):
+    """Case- and separator-insensitive shard name ("New York" == "new-york")"""
+    return re.sub(r'[\s_-]+', '-', str(value).strip()).lower()
+
+
+def request_regions(record):
+    """Candidate shard names of a request, in routing order"""
+    candidates = []
+    for field in REGION_FIELDS:
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            continue
+        if field == 'city':
+            if ',' not in value:
+                continue
+            value = value.rsplit(',', 1)[1]
+        candidates.append(region_key(value))
+    return candidates
+
+
+class _Shard:
+    def __init__(self, region):
+        self.region = region
+        self.lock = threading.Lock()
+        self.handle = None
+        self.size = 0
+        self.requests = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = None
+        self.last_error = None
+
+
+class ShardRouter:
+    """Routes requests to per-region models, loading them on first use
+
+    Each subdirectory of regions_dir is one shard holding versioned artifacts
+    like MODEL_DIR (CA/house_price_model-<version>.ubj). Nothing is loaded at
+    startup; resident shards are kept in an LRU whose total artifact file
+    size stays under artifact_budget bytes, so cold regions cost neither
+    startup time nor memory. The budget counts bytes on disk, not the
+    memory a loaded booster takes, which depends on the backend. Requests
+    for regions without a shard, or whose shard fails to load, go to the
+    global model.
+
+    regions_dir is scanned once here; call rescan() from a background
+    thread to pick up new shards and versions, so requests never wait on it.
+    """
+
+    def __init__(self, regions_dir, loader, artifact_budget):
+        self.regions_dir = regions_dir
+        self.loader = loader
+        self.artifact_budget = artifact_budget
+        # Requests naming a region that had no shard or whose shard failed to load
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._shards = {}
+        self._resident = OrderedDict()
+        self._available = {}
+        self.rescan()
+
+    def _scan(self):
+        available = {}
+        if self.regions_dir and os.path.isdir(self.regions_dir):
+            for name in os.listdir(self.regions_dir):
+                artifacts = list_artifacts(os.path.join(self.regions_dir, name))
+                if artifacts:
+                    available[region_key(name)] = artifacts[-1]
+        return available
+
+    def rescan(self):
+        # Readers keep using the previous dict until the new one is assigned
+        self._available = self._scan()
+
+    def available(self):
+        """Newest artifact path of every shard as of the last rescan"""
+        return self._available
+
+    def route(self, record):
+        """Shard name serving a request, or None for the global model"""
+        available = self.available()
+        if not available:
+            return None
+        candidates = request_regions(record)
+        for region in candidates:
+            if region in available:
+                return region
+        if candidates:
+            with self._lock:
+                self.fallbacks += 1
+        return None
+
+    def _shard(self, region):
+        with self._lock:
+            shard = self._shards.get(region)
+            if shard is None:
+                shard = self._shards[region] = _Shard(region)
+            return shard
+
+    def get(self, region):
+        """Handle of a shard's model, loading (or reloading a newer version) on demand
+
+        Returns None when the shard cannot be loaded.
+        """
+        path = self.available().get(region)
+        if path is None:
+            return None
+        shard = self._shard(region)
+        with self._lock:
+            shard.requests += 1
+            handle = shard.handle
+            if handle is not None:
+                self._resident.move_to_end(region)
+        if handle is not None and handle.path == path:
+            return handle
+
+        # Only callers of this region wait for its load
+        with shard.lock:
+            handle = shard.handle
+            if handle is not None and handle.path == path:
+                return handle
+            try:
+                handle = self.loader(path)
+            except Exception as e:
+                with self._lock:
+                    shard.last_error = str(e)
+                    self.fallbacks += 1
+                print(f"Loading model shard {region} failed: {str(e)}")
+                return None
+            size = os.path.getsize(path)
+            with self._lock:
+                shard.handle = handle
+                shard.size = size
+                shard.loads += 1
+                shard.load_seconds = handle.load_seconds
+                shard.last_error = None
+                self._resident[region] = shard
+                self._resident.move_to_end(region)
+                self._evict()
+            return handle
+
+    def _evict(self):
+        # The shard just loaded is never evicted, even if alone it exceeds the budget
+        while len(self._resident) > 1 and self.resident_bytes() > self.artifact_budget:
+            _, shard = self._resident.popitem(last=False)
+            shard.handle = None
+            shard.size = 0
+            shard.evictions += 1
+
+    def resident_bytes(self):
+        """Artifact file bytes of the loaded shards"""
+        return sum(shard.size for shard in self._resident.values())
+
+    def shard_stats(self):
+        with self._lock:
+            return {
+                region: {
+                    'requests': shard.requests,
+                    'loads': shard.loads,
+                    'evictions': shard.evictions,
+                    'resident': shard.handle is not None,
+                    'version': shard.handle.version if shard.handle is not None else None,
+                    'bytes': shard.size,
+                    'loadSeconds': shard.load_seconds,
+                    'lastError': shard.last_error
+                }
+                for region, shard in self._shards.items()
+            }
+
+    def stats(self):
+        shards = self.shard_stats()
+        with self._lock:
+            return {
+                'regionsDir': self.regions_dir,
+                'available': sorted(self.available()),
+                'resident': list(self._resident),
+                'residentBytes': self.resident_bytes(),
+                'artifactBudget': self.artifact_budget,
+                'fallbacks': self.fallbacks,
+                'shards': shards
+            }
@@ -0,0 +1,370 @@
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+FEATURE_NAMES = ['beds', 'baths', 'area', 'price']
+
+# Fixed histogram bin edges per feature; counts also include an underflow and
+# an overflow bin, as in utils.metrics.Histogram
+HISTOGRAM_EDGES = {
+    'beds': [0, 1, 2, 3, 4, 5, 6, 7, 8, 10],
+    'baths': [0, 1, 1.5, 2, 2.5, 3, 3.5, 4, 5, 6, 8],
+    'area': [0, 500, 750, 1000, 1250, 1500, 2000, 2500, 3000, 4000, 5000, 7500, 10000],
+    'price': [0, 100000, 200000, 300000, 400000, 500000, 750000, 1000000, 1500000,
+              2000000, 3000000, 5000000, 10000000],
+}
+
+REPORT_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# Population stability index above which a feature is reported as drifted
+PSI_DRIFT_THRESHOLD = 0.2
+
+# Flush intervals after which a spooled sketch file counts as left behind by
+# a worker that is gone
+STALE_FLUSHES = 3
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative error guarantees (DDSketch)
+
+    Positive values fall into logarithmic buckets of ratio gamma, so any
+    quantile is answered within relative_accuracy of the true value and
+    memory grows with the logarithm of the value range, not the count.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._inverse_log_gamma = 1 / self._log_gamma
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value):
+        # Inputs and prices are non-negative; anything at or below zero
+        # (or unparsable) lands in the zero bucket
+        self.count += 1
+        if value > 0:
+            index = math.ceil(math.log(value) * self._inverse_log_gamma)
+            bins = self.bins
+            if index in bins:
+                bins[index] += 1
+            else:
+                bins[index] = 1
+                if len(bins) > self.max_bins:
+                    self._collapse()
+        else:
+            self.zero_count += 1
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        self.count += len(values)
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            indexes, counts = np.unique(np.ceil(np.log(positive) * self._inverse_log_gamma).astype(np.int64),
+                                        return_counts=True)
+            for index, count in zip(indexes.tolist(), counts.tolist()):
+                self.bins[index] = self.bins.get(index, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+
+    def _collapse(self):
+        # Fold the lowest buckets together; high quantiles keep their accuracy
+        indexes = sorted(self.bins)
+        excess = len(indexes) - self.max_bins + 1
+        merged = sum(self.bins.pop(index) for index in indexes[:excess])
+        target = indexes[excess]
+        self.bins[target] += merged
+
+    def merge(self, other):
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.bins))
+
+    def to_dict(self):
+        return {
+            'relativeAccuracy': self.relative_accuracy,
+            'maxBins': self.max_bins,
+            'count': self.count,
+            'zeroCount': self.zero_count,
+            'bins': {str(index): count for index, count in self.bins.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relativeAccuracy'], data['maxBins'])
+        sketch.count = data['count']
+        sketch.zero_count = data['zeroCount']
+        sketch.bins = {int(index): count for index, count in data['bins'].items()}
+        return sketch
+
+
+class FeatureDistribution:
+    """Quantile sketch, fixed histogram and moments of one feature"""
+
+    def __init__(self, name, relative_accuracy=0.01):
+        self.name = name
+        self.edges = HISTOGRAM_EDGES[name]
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.histogram = [0] * (len(self.edges) + 1)
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        # Also rejects NaN, which compares false with everything
+        if not value < math.inf:
+            return
+        self.sketch.add(value)
+        self.histogram[bisect.bisect_right(self.edges, value)] += 1
+        self.total += value
+        if self.min is None:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        self.sketch.add_many(values)
+        bins = np.bincount(np.searchsorted(self.edges, values, side='right'),
+                           minlength=len(self.histogram))
+        for i, count in enumerate(bins.tolist()):
+            self.histogram[i] += count
+        self.total += float(values.sum())
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self):
+        count = self.sketch.count
+        return {
+            'count': count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / count if count else None,
+            'quantiles': {str(q): self.sketch.quantile(q) for q in REPORT_QUANTILES},
+            'histogram': {'edges': self.edges, 'counts': self.histogram}
+        }
+
+    def to_dict(self):
+        return {
+            'sketch': self.sketch.to_dict(),
+            'histogram': self.histogram,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, name, data):
+        distribution = cls(name)
+        distribution.sketch = QuantileSketch.from_dict(data['sketch'])
+        distribution.histogram = list(data['histogram'])
+        distribution.total = data['total']
+        distribution.min = data['min']
+        distribution.max = data['max']
+        return distribution
+
+
+def new_distributions():
+    return {name: FeatureDistribution(name) for name in FEATURE_NAMES}
+
+
+def distributions_to_dict(distributions):
+    return {name: distribution.to_dict() for name, distribution in distributions.items()}
+
+
+def distributions_from_dict(data):
+    return {name: FeatureDistribution.from_dict(name, data[name]) for name in FEATURE_NAMES if name in data}
+
+
+def build_reference(columns):
+    """Distributions of training data, from {'beds': [...], 'baths': [...], 'area': [...], 'price': [...]}"""
+    distributions = new_distributions()
+    for name, values in columns.items():
+        distributions[name].add_many(values)
+    return distributions_to_dict(distributions)
+
+
+def population_stability(expected, actual, epsilon=1e-4):
+    """PSI between two histograms over the same bins"""
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    if expected.sum() == 0 or actual.sum() == 0:
+        return None
+    expected = np.maximum(expected / expected.sum(), epsilon)
+    actual = np.maximum(actual / actual.sum(), epsilon)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def compare(live, reference):
+    """Per-feature quantile shifts and PSI of live traffic against the training reference"""
+    report = {}
+    for name in FEATURE_NAMES:
+        if name not in live or name not in reference:
+            continue
+        ours, theirs = live[name], reference[name]
+        shifts = {}
+        for q in REPORT_QUANTILES:
+            now, then = ours.sketch.quantile(q), theirs.sketch.quantile(q)
+            shifts[str(q)] = (now - then) / then if now is not None and then else None
+        psi = population_stability(theirs.histogram, ours.histogram)
+        report[name] = {
+            'psi': psi,
+            'drifted': psi is not None and psi > PSI_DRIFT_THRESHOLD,
+            'quantileShift': shifts
+        }
+    return report
+
+
+class DistributionMonitor:
+    """Streaming distributions of /predict inputs and predictions, merged across workers
+
+    Each worker updates its own sketches in memory and, when spool_dir is
+    set, writes them to sketch-<pid>.json there every flush_interval seconds.
+    merged() combines this worker's live state with the other workers' files.
+    A live worker rewrites its file every interval, so files left untouched
+    for STALE_FLUSHES intervals belong to exited workers and are ignored.
+    """
+
+    def __init__(self, spool_dir='', flush_interval=10.0):
+        self.spool_dir = spool_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._distributions = new_distributions()
+        self._flusher = None
+
+    def observe(self, beds, baths, area, price):
+        with self._lock:
+            distributions = self._distributions
+            distributions['beds'].add(beds)
+            distributions['baths'].add(baths)
+            distributions['area'].add(area)
+            distributions['price'].add(price)
+
+    def observe_many(self, matrix, prices):
+        with self._lock:
+            for i, name in enumerate(FEATURE_NAMES[:3]):
+                self._distributions[name].add_many(matrix[:, i])
+            self._distributions['price'].add_many(prices)
+
+    def _spool_path(self, pid=None):
+        return os.path.join(self.spool_dir, f'sketch-{pid or os.getpid()}.json')
+
+    def flush(self):
+        if not self.spool_dir:
+            return
+        with self._lock:
+            data = distributions_to_dict(self._distributions)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = self._spool_path()
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    def _spool_files(self):
+        return glob.glob(os.path.join(self.spool_dir, 'sketch-*.json'))
+
+    def clear_spool(self):
+        """Delete every worker's sketches, e.g. those of a previous run"""
+        if not self.spool_dir:
+            return
+        for path in self._spool_files() + glob.glob(os.path.join(self.spool_dir, 'sketch-*.json.tmp')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def forget_worker(self, pid):
+        """Delete the sketches of a worker that has exited"""
+        if not self.spool_dir:
+            return
+        try:
+            os.remove(self._spool_path(pid))
+        except OSError:
+            pass
+
+    def start_flusher(self):
+        if not self.spool_dir or self.flush_interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Writing input sketches failed: {str(e)}")
+
+        self._flusher = threading.Thread(target=run, name='sketch-flusher', daemon=True)
+        self._flusher.start()
+
+    def merged(self):
+        """(distributions over every worker, number of workers merged)"""
+        with self._lock:
+            merged = distributions_from_dict(distributions_to_dict(self._distributions))
+        workers = 1
+        if self.spool_dir:
+            own = self._spool_path()
+            oldest = time.time() - STALE_FLUSHES * self.flush_interval
+            for path in self._spool_files():
+                if path == own:
+                    continue
+                try:
+                    if os.path.getmtime(path) < oldest:
+                        continue
+                    with open(path, 'r', encoding='utf-8') as f:
+                        other = distributions_from_dict(json.load(f))
+                except (OSError, ValueError, KeyError):
+                    continue
+                for name, distribution in other.items():
+                    merged[name].merge(distribution)
+                workers += 1
+        return merged, workers
+
+
+def load_reference(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return distributions_from_dict(json.load(f))
@@ -0,0 +1,352 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from utils.listings import SOURCE_FILES, iter_listings, normalize_listing, parse_number
+
+FORMAT_VERSION = 1
+
+# Typed numeric columns; missing or unparsable values are NaN
+NUMERIC_COLUMNS = ['price', 'beds', 'baths', 'area', 'latitude', 'longitude']
+
+# String columns, stored dictionary-encoded: int32 codes (-1 = missing) into
+# a UTF-8 blob with offsets
+STRING_COLUMNS = ['source', 'locality', 'region', 'country', 'address', 'home_url', 'image_link']
+
+
+def _text(value):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def listing_strings(source, listing):
+    """String fields of a listing from any scraper, under the snapshot's column names"""
+    locality = listing.get('address_locality')
+    region = listing.get('address_region')
+    city = _text(listing.get('city'))
+    if city and ',' in city:
+        # Redfin formats cities as "San Diego, CA"
+        city_name, city_region = (part.strip() for part in city.rsplit(',', 1))
+        locality = locality or city_name
+        region = region or city_region
+    elif city:
+        locality = locality or city
+    country = listing.get('address_country') or listing.get('country')
+    return {
+        'source': source,
+        'locality': _text(locality),
+        'region': _text(region),
+        'country': _text(country),
+        'address': _text(listing.get('address') or listing.get('street_address')),
+        'home_url': _text(listing.get('home_url')),
+        'image_link': _text(listing.get('image_link')),
+    }
+
+
+class _DictionaryEncoder:
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class StringDictionary:
+    """Strings of a dictionary-encoded column, read lazily from the memory-mapped blob"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+        self._index = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code):
+        if code < 0:
+            return None
+        return bytes(self.blob[self.offsets[code]:self.offsets[code + 1]]).decode('utf-8')
+
+    def values(self, codes):
+        """Strings of many codes, with one gather of their offsets"""
+        codes = np.asarray(codes, dtype=np.int64)
+        present = codes >= 0
+        starts = np.zeros(len(codes), dtype=np.int64)
+        stops = np.zeros(len(codes), dtype=np.int64)
+        starts[present] = self.offsets[codes[present]]
+        stops[present] = self.offsets[codes[present] + 1]
+        blob = memoryview(self.blob)
+        return [bytes(blob[start:stop]).decode('utf-8') if keep else None
+                for start, stop, keep in zip(starts.tolist(), stops.tolist(), present.tolist())]
+
+    def code(self, value):
+        """Code of a string, or -1 when it never occurs; the lookup table is built on first use"""
+        if self._index is None:
+            self._index = {self[code]: code for code in range(len(self))}
+        return self._index.get(value, -1)
+
+
+def write_strings(directory, name, values):
+    """Save strings as name.dict.npy (UTF-8 blob) and name.offsets.npy, readable by StringDictionary"""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, f'{name}.dict.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(directory, f'{name}.offsets.npy'), offsets)
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def replace_directory(staging, out):
+    """Move a fully written staging directory to out, replacing what was there"""
+    previous = out.rstrip('/') + '.previous'
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(out):
+        os.replace(out, previous)
+    os.replace(staging, out)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def build_snapshot(sources, out):
+    """Parse scraper outputs once into a columnar snapshot directory at `out`
+
+    sources maps a source name to its JSON/NDJSON file. Listings are
+    de-duplicated by home_url (the last one scraped wins). The snapshot is
+    written next to `out` and renamed into place, so readers never see a
+    partial one.
+    """
+    numeric = {name: [] for name in NUMERIC_COLUMNS}
+    encoders = {name: _DictionaryEncoder() for name in STRING_COLUMNS}
+    codes = {name: [] for name in STRING_COLUMNS}
+    row_by_url = {}
+    signatures = {}
+
+    for source, path in sources.items():
+        signatures[source] = source_signature(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            for listing in iter_listings(f):
+                if not isinstance(listing, dict):
+                    continue
+                beds, baths, area, price = normalize_listing(listing)
+                values = {
+                    'price': price, 'beds': beds, 'baths': baths, 'area': area,
+                    'latitude': parse_number(listing.get('latitude')),
+                    'longitude': parse_number(listing.get('longitude')),
+                }
+                strings = listing_strings(source, listing)
+                row = row_by_url.get(strings['home_url']) if strings['home_url'] else None
+                if row is None:
+                    row = len(numeric['price'])
+                    if strings['home_url']:
+                        row_by_url[strings['home_url']] = row
+                    for name in NUMERIC_COLUMNS:
+                        numeric[name].append(np.nan)
+                    for name in STRING_COLUMNS:
+                        codes[name].append(-1)
+                for name in NUMERIC_COLUMNS:
+                    numeric[name][row] = np.nan if values[name] is None else values[name]
+                for name in STRING_COLUMNS:
+                    codes[name][row] = encoders[name].encode(strings[name])
+
+    staging = out.rstrip('/') + '.building'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name in NUMERIC_COLUMNS:
+        np.save(os.path.join(staging, f'{name}.npy'), np.array(numeric[name], dtype=np.float64))
+    for name in STRING_COLUMNS:
+        np.save(os.path.join(staging, f'{name}.codes.npy'), np.array(codes[name], dtype=np.int32))
+        write_strings(staging, name, encoders[name].values)
+
+    meta = {
+        'formatVersion': FORMAT_VERSION,
+        'builtAt': time.time(),
+        'rows': len(numeric['price']),
+        'numericColumns': NUMERIC_COLUMNS,
+        'stringColumns': STRING_COLUMNS,
+        'sources': signatures
+    }
+    with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    replace_directory(staging, out)
+    return meta
+
+
+class ReopeningDirectory:
+    """Opens a directory written through replace_directory, again whenever it is replaced
+
+    meta.json is checked at most every check_interval seconds. The first
+    version is opened by the caller that asks for it; later versions are
+    opened in a background thread while the previous one keeps being
+    served, so an opener that builds indexes never delays a request. When
+    opening a new version fails, the previous one stays.
+    """
+
+    def __init__(self, path, opener, check_interval=5.0):
+        self.path = path
+        self.opener = opener
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._current = None
+        self._signature = None
+        self._opening = None
+        self._checked_at = 0.0
+        self.last_error = None
+
+    def _meta_signature(self):
+        try:
+            stat = os.stat(os.path.join(self.path, 'meta.json'))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open(self, signature):
+        try:
+            opened = self.opener(self.path)
+        except (OSError, ValueError, KeyError) as e:
+            self.last_error = str(e)
+            print(f"Opening {self.path} failed: {str(e)}")
+            return
+        # One assignment: readers get the old or the new version, whole
+        self._current = opened
+        self._signature = signature
+        self.last_error = None
+
+    def _open_in_background(self, signature):
+        try:
+            self._open(signature)
+        finally:
+            with self._lock:
+                self._opening = None
+
+    def current(self):
+        """The opened directory, or None when there is none"""
+        now = time.monotonic()
+        if self._current is not None and now - self._checked_at < self.check_interval:
+            return self._current
+        with self._lock:
+            self._checked_at = now
+            signature = self._meta_signature()
+            if signature is not None and signature not in (self._signature, self._opening):
+                if self._current is None:
+                    self._open(signature)
+                else:
+                    self._opening = signature
+                    threading.Thread(target=self._open_in_background, args=(signature,),
+                                     name=f'reopen-{os.path.basename(self.path)}', daemon=True).start()
+            return self._current
+
+
+class Snapshot:
+    """Read-only view of a snapshot directory; every column is memory-mapped, nothing is parsed"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['formatVersion'] != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot format {self.meta['formatVersion']}")
+        self.rows = self.meta['rows']
+        self._columns = {}
+        self._dictionaries = {}
+
+    def __len__(self):
+        return self.rows
+
+    def _load(self, filename):
+        return np.load(os.path.join(self.path, filename), mmap_mode='r')
+
+    def column(self, name):
+        """Float64 values of a numeric column, or int32 codes of a string column"""
+        array = self._columns.get(name)
+        if array is None:
+            if name in self.meta['numericColumns']:
+                array = self._load(f'{name}.npy')
+            elif name in self.meta['stringColumns']:
+                array = self._load(f'{name}.codes.npy')
+            else:
+                raise KeyError(f'unknown snapshot column {name}')
+            self._columns[name] = array
+        return array
+
+    def dictionary(self, name):
+        dictionary = self._dictionaries.get(name)
+        if dictionary is None:
+            dictionary = self._dictionaries[name] = StringDictionary(
+                self._load(f'{name}.dict.npy'), self._load(f'{name}.offsets.npy'))
+        return dictionary
+
+    def row(self, index):
+        """One listing as a dict with the snapshot's column names"""
+        result = {'id': int(index)}
+        for name in self.meta['numericColumns']:
+            value = float(self.column(name)[index])
+            result[name] = None if value != value else value
+        for name in self.meta['stringColumns']:
+            result[name] = self.dictionary(name)[int(self.column(name)[index])]
+        return result
+
+    def rows_at(self, indices):
+        """Listings at many rows, gathered one column at a time"""
+        indices = np.asarray(indices, dtype=np.int64)
+        rows = [{'id': index} for index in indices.tolist()]
+        for name in self.meta['numericColumns']:
+            values = np.asarray(self.column(name)[indices], dtype=np.float64)
+            for row, value in zip(rows, values.tolist()):
+                row[name] = None if value != value else value
+        for name in self.meta['stringColumns']:
+            strings = self.dictionary(name).values(self.column(name)[indices])
+            for row, value in zip(rows, strings):
+                row[name] = value
+        return rows
+
+
+def default_sources():
+    """The scraper outputs under script/ that exist"""
+    return {source: path for source, path in SOURCE_FILES.items() if os.path.exists(path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar snapshot of the scraped listings')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='parse the scraper outputs into a snapshot directory')
+    build.add_argument('sources', nargs='*', metavar='SOURCE=PATH',
+                       help='scraper outputs (default: the script/*_home_data.json files present)')
+    build.add_argument('--out', default='./utils/listings_snapshot')
+    info = commands.add_parser('info', help='describe a snapshot')
+    info.add_argument('path', nargs='?', default='./utils/listings_snapshot')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        sources = dict(source.split('=', 1) for source in args.sources) if args.sources else default_sources()
+        if not sources:
+            sys.exit('No scraper outputs found; pass SOURCE=PATH arguments')
+        started = time.perf_counter()
+        meta = build_snapshot(sources, args.out)
+        print(f"Snapshot of {meta['rows']} listings from {', '.join(sources)} written to {args.out} "
+              f"in {time.perf_counter() - started:.2f}s")
+    elif args.command == 'info':
+        snapshot = Snapshot(args.path)
+        print(json.dumps(snapshot.meta, indent=2))
+
+
+if __name__ == '__main__':
+    main()
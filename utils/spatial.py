@@ -0,0 +1,144 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distance from one point to arrays of points"""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GridIndex:
+    """Listings bucketed into fixed lat/lon cells, stored sorted by cell
+
+    Cell ids run row-major (latitude band, then longitude), so the cells of
+    one latitude band inside a bounding box are a contiguous range of the
+    sorted arrays: a box query is one binary search per band plus a scan of
+    just the candidate listings. Results come back in sorted-array order,
+    which makes the position of the last result a stable keyset cursor.
+    """
+
+    def __init__(self, latitude, longitude, cell_degrees=0.05):
+        self.cell_degrees = cell_degrees
+        self.columns = int(math.ceil(360 / cell_degrees))
+        self.bands = int(math.ceil(180 / cell_degrees))
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        valid = (np.isfinite(latitude) & np.isfinite(longitude)
+                 & (np.abs(latitude) <= 90) & (np.abs(longitude) <= 180))
+        rows = np.flatnonzero(valid)
+        cells = self._cells(latitude[rows], longitude[rows])
+        order = np.argsort(cells, kind='stable')
+        self.rows = rows[order]
+        self.cells = cells[order]
+        self.latitude = latitude[self.rows]
+        self.longitude = longitude[self.rows]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _band(self, lat):
+        return np.minimum(((np.asarray(lat) + 90) // self.cell_degrees).astype(np.int64), self.bands - 1)
+
+    def _column(self, lon):
+        return np.minimum(((np.asarray(lon) + 180) // self.cell_degrees).astype(np.int64), self.columns - 1)
+
+    def _cells(self, lat, lon):
+        return self._band(lat) * self.columns + self._column(lon)
+
+    def _spans(self, south, west, north, east):
+        """(start, stop) ranges of the sorted arrays covering a box, in position order"""
+        bands = np.arange(int(self._band(south)), int(self._band(north)) + 1, dtype=np.int64)
+        if west <= east:
+            column_ranges = [(int(self._column(west)), int(self._column(east)))]
+        else:
+            # The box crosses the antimeridian
+            column_ranges = [(int(self._column(west)), self.columns - 1), (0, int(self._column(east)))]
+        starts, stops = [], []
+        for first, last in column_ranges:
+            starts.append(np.searchsorted(self.cells, bands * self.columns + first, side='left'))
+            stops.append(np.searchsorted(self.cells, bands * self.columns + last, side='right'))
+        starts, stops = np.concatenate(starts), np.concatenate(stops)
+        order = np.argsort(starts, kind='stable')
+        return starts[order], stops[order]
+
+    def _inside(self, positions, south, west, north, east):
+        lat = self.latitude[positions]
+        lon = self.longitude[positions]
+        inside = (lat >= south) & (lat <= north)
+        if west <= east:
+            return inside & (lon >= west) & (lon <= east)
+        return inside & ((lon >= west) | (lon <= east))
+
+    def bbox(self, south, west, north, east, limit=200, after=-1):
+        """Snapshot rows inside the box, at most `limit`, after cursor position `after`
+
+        Returns (rows, next cursor or None when there are no more).
+        """
+        if south > north:
+            return np.empty(0, dtype=np.int64), None
+        starts, stops = self._spans(south, west, north, east)
+        found = []
+        count = 0
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            start = max(start, after + 1)
+            if start >= stop:
+                continue
+            positions = np.arange(start, stop)
+            positions = positions[self._inside(positions, south, west, north, east)]
+            if len(positions):
+                found.append(positions)
+                count += len(positions)
+                if count > limit:
+                    break
+        if not found:
+            return np.empty(0, dtype=np.int64), None
+        positions = np.concatenate(found)
+        more = len(positions) > limit
+        positions = positions[:limit]
+        return self.rows[positions], int(positions[-1]) if more else None
+
+    def radius(self, lat, lon, radius_km, limit=200, after=None):
+        """Snapshot rows within radius_km, nearest first, with their distances
+
+        `after` is the (distance, row) of the last result of the previous
+        page. Returns (rows, distances, next cursor or None).
+        """
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+        cos_lat = min(math.cos(math.radians(south)), math.cos(math.radians(north)))
+        if south <= -90 or north >= 90 or cos_lat <= 1e-9 or dlat / cos_lat >= 180:
+            west, east = -180.0, 180.0
+        else:
+            dlon = dlat / cos_lat
+            west = (lon - dlon + 180) % 360 - 180
+            east = (lon + dlon + 180) % 360 - 180
+
+        starts, stops = self._spans(south, west, north, east)
+        positions = np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops)]
+                                   or [np.empty(0, dtype=np.int64)])
+        distances = haversine_km(lat, lon, self.latitude[positions], self.longitude[positions])
+        within = distances <= radius_km
+        positions, distances = positions[within], distances[within]
+        rows = self.rows[positions]
+        if after is not None:
+            last_distance, last_row = after
+            later = (distances > last_distance) | ((distances == last_distance) & (rows > last_row))
+            rows, distances = rows[later], distances[later]
+
+        # Only the page needs a full sort. Every row tied with the last one
+        # is kept, so the (distance, row) order decides which make the page
+        if len(rows) > limit + 1:
+            nearest = distances <= np.partition(distances, limit)[limit]
+            rows, distances = rows[nearest], distances[nearest]
+        order = np.lexsort((rows, distances))
+        rows, distances = rows[order], distances[order]
+        more = len(rows) > limit
+        rows, distances = rows[:limit], distances[:limit]
+        cursor = (float(distances[-1]), int(rows[-1])) if more else None
+        return rows, distances, cursor
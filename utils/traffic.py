@@ -0,0 +1,247 @@
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+MAGIC = b'PRCAP1\n'
+
+# Wall-clock arrival time, beds, baths, area, server latency in seconds, HTTP status
+RECORD = struct.Struct('<d3dfH')
+
+
+class TrafficRecorder:
+    """Appends sampled /predict calls to a binary capture log
+
+    Each process writes its own capture-<pid>.bin under `directory`, so
+    pre-forked workers never interleave writes. When the file passes
+    max_bytes it is renamed to .1 (older ones shift up to `backups`) and a
+    new one is started.
+    """
+
+    def __init__(self, directory, sample_rate=1.0, max_bytes=64 << 20, backups=5, flush_interval=1.0):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._size = 0
+        self._flushed_at = 0.0
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f'capture-{os.getpid()}.bin')
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # A forked worker must not write through the master's file object
+        self._pid = os.getpid()
+        self._file = open(self.path, 'ab')
+        self._size = self._file.tell()
+        if self._size == 0:
+            self._file.write(MAGIC)
+            self._size = len(MAGIC)
+
+    def _rotate(self):
+        self._file.close()
+        path = self.path
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{path}.{index}'):
+                os.replace(f'{path}.{index}', f'{path}.{index + 1}')
+        if self.backups > 0:
+            os.replace(path, f'{path}.1')
+        else:
+            os.remove(path)
+        self._open()
+
+    def record(self, arrived_at, beds, baths, area, latency, status):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        data = RECORD.pack(arrived_at, beds, baths, area, latency, status)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            self._file.write(data)
+            self._size += len(data)
+            self.recorded += 1
+            now = time.monotonic()
+            if now - self._flushed_at >= self.flush_interval:
+                # Buffered writes keep the per-request cost to a memcpy;
+                # workers exit without cleanup, so flush at least this often
+                self._file.flush()
+                self._flushed_at = now
+            if self._size >= self.max_bytes:
+                self._rotate()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+            self._file = None
+            self._pid = None
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'sampleRate': self.sample_rate,
+            'maxBytes': self.max_bytes,
+            'recorded': self.recorded
+        }
+
+
+def read_capture(path):
+    """Records of one capture file as tuples, skipping a partially written tail"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < len(MAGIC) and MAGIC.startswith(data):
+        # Created by a worker that has not flushed its first records yet
+        return []
+    if not data.startswith(MAGIC):
+        raise ValueError(f'{path} is not a prediction capture file')
+    body = data[len(MAGIC):]
+    usable = len(body) - len(body) % RECORD.size
+    return list(RECORD.iter_unpack(body[:usable]))
+
+
+def load_captures(paths):
+    """Records of every capture file (globs and directories allowed), ordered by arrival"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, 'capture-*.bin*'))))
+        else:
+            files.extend(sorted(glob.glob(path)) or [path])
+    records = []
+    for path in files:
+        records.extend(read_capture(path))
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def percentiles(values):
+    if not len(values):
+        return {'p50': None, 'p90': None, 'p99': None}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99]) * 1000.0
+    return {'p50': float(p50), 'p90': float(p90), 'p99': float(p99)}
+
+
+class _Client:
+    """One keep-alive HTTP connection per replay thread"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path.rstrip('/') + '/predict'
+        self._local = threading.local()
+
+    def post(self, body):
+        for attempt in range(2):
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                connection.request('POST', self.path, body, {'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                if response.will_close:
+                    connection.close()
+                    self._local.connection = None
+                return response.status
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+
+def replay(records, url, speed=1.0, concurrency=16):
+    """Re-issue captured calls against url at `speed` times the captured pace (None = as fast as possible)
+
+    Returns throughput, client-side latency percentiles in ms and status
+    counts, next to the server-side percentiles that were captured.
+    """
+    client = _Client(url)
+    latencies = []
+    statuses = {}
+    lag = []
+    lock = threading.Lock()
+
+    def send(record):
+        body = json.dumps({'beds': record[1], 'baths': record[2], 'area': record[3]})
+        started = time.perf_counter()
+        try:
+            status = client.post(body)
+        except (http.client.HTTPException, OSError):
+            status = 'error'
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        if speed is None:
+            list(pool.map(send, records))
+        elif records:
+            origin = records[0][0]
+            for record in records:
+                due = started + (record[0] - origin) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    lag.append(-delay)
+                pool.submit(send, record)
+    duration = time.perf_counter() - started
+
+    captured = [record[4] for record in records]
+    return {
+        'requests': len(records),
+        'speed': 'max' if speed is None else speed,
+        'concurrency': concurrency,
+        'seconds': duration,
+        'throughput': len(records) / duration if duration > 0 else None,
+        'statuses': statuses,
+        'latencyMs': percentiles(np.array(latencies)),
+        'capturedLatencyMs': percentiles(np.array(captured)),
+        'maxScheduleLagMs': max(lag) * 1000.0 if lag else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured /predict traffic')
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = commands.add_parser('replay', help='re-issue a capture against a running server')
+    replay_parser.add_argument('captures', nargs='+', help='capture files, globs or PREDICT_CAPTURE_DIR')
+    replay_parser.add_argument('--url', default='http://127.0.0.1:5000')
+    replay_parser.add_argument('--speed', default='1',
+                               help='multiple of the captured pace, e.g. 1 or 10, or "max"')
+    replay_parser.add_argument('--concurrency', type=int, default=16)
+    replay_parser.add_argument('--limit', type=int, default=0, help='replay only the first N calls')
+    args = parser.parse_args()
+
+    records = load_captures(args.captures)
+    if args.limit:
+        records = records[:args.limit]
+    speed = None if args.speed == 'max' else float(args.speed)
+    pace = 'full speed' if speed is None else f'{speed:g}x'
+    print(f"Replaying {len(records)} calls at {pace} against {args.url}", file=sys.stderr)
+    print(json.dumps(replay(records, args.url, speed, args.concurrency), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import struct
+
+import numpy as np
+
+# Fixed-size UBJSON scalar types: marker -> (struct format, NumPy dtype)
+SCALARS = {
+    b'i': ('>b', '>i1'),
+    b'U': ('>B', '>u1'),
+    b'I': ('>h', '>i2'),
+    b'l': ('>i', '>i4'),
+    b'L': ('>q', '>i8'),
+    b'd': ('>f', '>f4'),
+    b'D': ('>d', '>f8'),
+}
+
+
+class Reader:
+    """Minimal UBJSON decoder, enough for XGBoost's native .ubj model files
+
+    Strongly typed arrays (the bulk of a model) are decoded straight into
+    NumPy arrays instead of Python lists.
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def _take(self, n):
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def _marker(self):
+        marker = bytes(self._take(1))
+        while marker == b'N':
+            marker = bytes(self._take(1))
+        return marker
+
+    def _scalar(self, marker):
+        fmt, _ = SCALARS[marker]
+        return struct.unpack(fmt, self._take(struct.calcsize(fmt)))[0]
+
+    def _length(self):
+        return int(self._scalar(self._marker()))
+
+    def _string(self):
+        return str(self._take(self._length()), 'utf-8')
+
+    def value(self, marker=None):
+        marker = marker or self._marker()
+        if marker in SCALARS:
+            return self._scalar(marker)
+        if marker == b'S' or marker == b'H':
+            return self._string()
+        if marker == b'C':
+            return chr(self._take(1)[0])
+        if marker == b'T':
+            return True
+        if marker == b'F':
+            return False
+        if marker == b'Z':
+            return None
+        if marker == b'[':
+            return self._array()
+        if marker == b'{':
+            return self._object()
+        raise ValueError(f'unsupported UBJSON marker {marker!r} at offset {self.pos - 1}')
+
+    def _container_header(self):
+        """Optional $type and #count of an optimized container"""
+        item_type = count = None
+        marker = self._marker()
+        if marker == b'$':
+            item_type = self._marker()
+            marker = self._marker()
+        if marker == b'#':
+            count = self._length()
+            marker = None
+        return item_type, count, marker
+
+    def _array(self):
+        item_type, count, marker = self._container_header()
+        if count is not None:
+            if item_type in SCALARS:
+                dtype = np.dtype(SCALARS[item_type][1])
+                raw = self._take(count * dtype.itemsize)
+                return np.frombuffer(raw, dtype=dtype).astype(dtype.newbyteorder('='))
+            return [self.value(item_type) for _ in range(count)]
+        items = []
+        while marker != b']':
+            items.append(self.value(marker))
+            marker = self._marker()
+        return items
+
+    def _object(self):
+        item_type, count, marker = self._container_header()
+        result = {}
+        if count is not None:
+            for _ in range(count):
+                key = self._string()
+                result[key] = self.value(item_type)
+            return result
+        while marker != b'}':
+            # Object keys omit the S marker; `marker` is the key length's type
+            key = str(self._take(int(self._scalar(marker))), 'utf-8')
+            result[key] = self.value()
+            marker = self._marker()
+        return result
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return Reader(f.read()).value()